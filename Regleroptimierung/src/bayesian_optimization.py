@@ -0,0 +1,81 @@
+import logging
+import warnings
+
+import numpy as np
+from scipy.stats import norm
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+
+def latin_hypercube(n_points, dim, rng):
+    """Latin-Hypercube-Stichprobe im Einheitswürfel: jede Dimension wird in `n_points` Schichten je einmal getroffen."""
+    strata = np.stack([rng.permutation(n_points) for _ in range(dim)], axis=1)
+    return (strata + rng.random((n_points, dim))) / n_points
+
+
+def expected_improvement(mean, std, best_value, xi=0.01):
+    """Erwartete Verbesserung gegenüber `best_value` für ein Minimierungsproblem."""
+    std = np.maximum(std, 1e-12)
+    improvement = best_value - mean - xi
+    z = improvement / std
+    return improvement * norm.cdf(z) + std * norm.pdf(z)
+
+
+def _fit_gp(x, y, seed):
+    dim = x.shape[1]
+    kernel = ConstantKernel(1.0, (1e-3, 1e3)) * Matern(length_scale=np.full(dim, 0.3), length_scale_bounds=(1e-2, 10.0),
+                                                       nu=2.5) + WhiteKernel(1e-6, (1e-10, 1e-2))
+    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2, random_state=seed)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        gp.fit(x, y)
+    return gp
+
+
+def bayesian_optimize(evaluate, bounds, n_initial=8, batch_size=4, n_iterations=8, n_candidates=2048, seed=0):
+    """
+    Bayes'sche Optimierung mit Gauß-Prozess und Expected Improvement (Minimierung).
+
+    Nach einer Latin-Hypercube-Initialisierung wird in jeder Iteration ein GP (Matern-5/2) auf alle bisherigen
+    Punkte angepasst. Ein Batch von `batch_size` Kandidaten wird nacheinander per EI-Maximum über zufällige
+    Kandidaten gewählt; nach jeder Wahl wird der GP-Mittelwert als vorläufige Beobachtung eingetragen
+    ("Kriging Believer"), damit sich die Kandidaten eines Batches nicht häufen.
+    :param evaluate: Funktion, die ein Array (n, dim) von Parametern in einem Aufruf auswertet und (n,) zurückgibt.
+    :param bounds: Liste von (min, max) je Parameter.
+    :return: Dict mit best_params, best_value, n_evaluations und allen ausgewerteten Punkten (history).
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    rng = np.random.default_rng(seed)
+
+    def to_params(x):
+        return low + x * span
+
+    x = latin_hypercube(n_initial, len(bounds), rng)
+    y = np.asarray(evaluate(to_params(x)), dtype=np.float64)
+    logging.warning(f"Bayes-Optimierung: {n_initial} Startpunkte, bester Wert {y.min():.4f}")
+
+    for iteration in range(n_iterations):
+        x_fantasy, y_fantasy = x, y
+        batch = []
+        for _ in range(batch_size):
+            gp = _fit_gp(x_fantasy, y_fantasy, seed)
+            # Zufällige Kandidaten plus lokale Störungen um den bisher besten Punkt
+            candidates = np.concatenate([rng.random((n_candidates, len(bounds))),
+                                         np.clip(x[np.argmin(y)] + 0.05 * rng.standard_normal((n_candidates // 4, len(bounds))),
+                                                 0.0, 1.0)])
+            mean, std = gp.predict(candidates, return_std=True)
+            choice = candidates[np.argmax(expected_improvement(mean, std, y.min()))]
+            batch.append(choice)
+            x_fantasy = np.vstack([x_fantasy, choice])
+            y_fantasy = np.append(y_fantasy, gp.predict(choice[np.newaxis])[0])
+        batch = np.array(batch)
+        x = np.vstack([x, batch])
+        y = np.append(y, evaluate(to_params(batch)))
+        logging.warning(f"Bayes-Optimierung Iteration {iteration + 1}/{n_iterations}: {len(y)} Auswertungen, "
+                        f"bester Wert {y.min():.4f}")
+
+    best = int(np.argmin(y))
+    return {"best_params": to_params(x[best]).tolist(), "best_value": float(y[best]), "n_evaluations": int(len(y)),
+            "history": [(params.tolist(), float(value)) for params, value in zip(to_params(x), y)]}
@@ -0,0 +1,115 @@
+import copy
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+from dataset import import_data
+from models import MLPModel, CNNModel, LSTMModel
+from training import train_model, device
+from utils import bf16_autocast
+
+
+def synthetic_dataset(n_samples, time_horizon, input_dim, seed=0):
+    """Synthetischer Datensatz mit der Form der HAST-Daten (Inputs in [0, 1], glatte Target-Kurven)."""
+    generator = torch.Generator().manual_seed(seed)
+    inputs = torch.rand(n_samples, time_horizon, input_dim, generator=generator)
+    targets = 30 + 10 * torch.cumsum(inputs.mean(dim=2) - 0.5, dim=1) / np.sqrt(time_horizon)
+    return TensorDataset(inputs, targets)
+
+
+def build_models(time_horizon, input_dim):
+    """Die drei Modelle aus models.py mit passender Sequenzlänge und Ausgabedimension."""
+    return {
+        "MLP": MLPModel(input_dim=input_dim, output_dim=time_horizon, sequence_length=time_horizon),
+        "CNN": CNNModel(input_features=input_dim, sequence_length=time_horizon, n_layers=5, batch_norm=False,
+                        dropout_rate=0.5, kernel_size=5, size_out=time_horizon, pool=False),
+        "LSTM": LSTMModel(input_size=input_dim, output_size=time_horizon),
+    }
+
+
+def evaluate(model, loader, mixed_precision):
+    """Mittlerer L1-Fehler und Vorhersagen eines Modells auf `loader`."""
+    model.eval()
+    total_loss = 0
+    all_preds = []
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision):
+        for inputs, targets in loader:
+            outputs = model(inputs.to(device)).float()
+            total_loss += torch.mean(torch.abs(outputs - targets.to(device))).item()
+            all_preds.append(outputs.cpu())
+    return total_loss / len(loader), torch.cat(all_preds)
+
+
+def benchmark_model(model, train_loader, val_loader, epochs, mixed_precision, learning_rate=1e-3):
+    """Trainiert eine Kopie des Modells und misst Trainings- und Inferenzzeit."""
+    model = copy.deepcopy(model).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate, weight_decay=1e-2)
+    criterion = nn.L1Loss()
+
+    start = time.perf_counter()
+    for _ in range(epochs):
+        train_model(model, train_loader, optimizer, criterion, mixed_precision=mixed_precision)
+    train_time = (time.perf_counter() - start) / epochs
+
+    start = time.perf_counter()
+    val_loss, preds = evaluate(model, val_loader, mixed_precision)
+    eval_time = time.perf_counter() - start
+    return {"train_time_per_epoch": train_time, "eval_time": eval_time, "val_loss": val_loss}, model, preds
+
+
+def run_benchmark(datasets, time_horizon, input_dim, epochs=3, batch_size=64):
+    """
+    Vergleicht float32 und bfloat16-Autocast für alle Modelle auf allen Datensätzen.
+
+    Berichtet die Beschleunigung von Training und Inferenz, die Differenz im Validierungs-L1 nach gleichem Training
+    sowie die Abweichung der bfloat16-Inferenz von der float32-Inferenz bei identischen Gewichten.
+    """
+    results = []
+    for data_name, (train_dataset, val_dataset) in datasets.items():
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, drop_last=True)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, drop_last=True)
+        for model_name, model in build_models(time_horizon, input_dim).items():
+            torch.manual_seed(0)
+            fp32, fp32_model, fp32_preds = benchmark_model(model, train_loader, val_loader, epochs, mixed_precision=False)
+            torch.manual_seed(0)
+            bf16, _, _ = benchmark_model(model, train_loader, val_loader, epochs, mixed_precision=True)
+            _, bf16_preds = evaluate(fp32_model, val_loader, mixed_precision=True)
+            result = {
+                "data": data_name,
+                "model": model_name,
+                "fp32": fp32,
+                "bf16": bf16,
+                "train_speedup": fp32["train_time_per_epoch"] / bf16["train_time_per_epoch"],
+                "eval_speedup": fp32["eval_time"] / bf16["eval_time"],
+                "val_loss_difference": bf16["val_loss"] - fp32["val_loss"],
+                "inference_abs_difference": torch.mean(torch.abs(bf16_preds - fp32_preds)).item(),
+            }
+            logging.warning(f"{data_name} / {model_name}: Training x{result['train_speedup']:.2f}, "
+                            f"Inferenz x{result['eval_speedup']:.2f}, "
+                            f"Delta Val Loss = {result['val_loss_difference']:.4f}, "
+                            f"Delta Inferenz = {result['inference_abs_difference']:.4f}")
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    time_horizon = 150
+    train_dataset, val_dataset, _ = import_data(time_horizon=time_horizon, test_run=True)
+    input_dim = train_dataset.input_dim()
+    datasets = {
+        "dummy": (train_dataset, val_dataset),
+        "synthetic": (synthetic_dataset(4096, time_horizon, input_dim, seed=0),
+                      synthetic_dataset(1024, time_horizon, input_dim, seed=1)),
+    }
+    results = run_benchmark(datasets, time_horizon, input_dim)
+
+    experiments_dir = Path("../experiments") / "Benchmark_mixed_precision"
+    experiments_dir.mkdir(parents=True, exist_ok=True)
+    with open(experiments_dir / "benchmark.json", "w") as f:
+        json.dump(results, f, indent=2)
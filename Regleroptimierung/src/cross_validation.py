@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import Subset
+
+from dataset import HAST_Dataset
+from models import build_model
+from training import train_and_optimize
+
+# Der vorbereitete Datensatz, wird einmal pro Worker-Prozess übergeben
+_dataset = None
+
+
+def sample_time_positions(dataset):
+    """Position (Zeile innerhalb der Zeitreihe) des ersten Zeitschritts jedes Samples."""
+    rows_per_setup = dataset.time_series_inputs.shape[0]
+    return (np.arange(len(dataset)) * dataset.time_horizon) % rows_per_setup
+
+
+def rolling_origin_folds(dataset, n_folds=4, mode="expanding", window_blocks=1, gap=None):
+    """
+    Zeitreihen-Folds mit rollierendem Ursprung über die Zeitachse eines Datensatzes.
+
+    Die Zeitachse wird in `n_folds + 1` gleich große Blöcke geteilt. Fold k validiert auf Block k + 1 und trainiert
+    auf allen Blöcken davor ("expanding") bzw. auf den `window_blocks` Blöcken direkt davor ("sliding").
+    Ein Sample wird nur verwendet, wenn sein ganzes Fenster (`time_horizon` Zeilen) innerhalb eines Setups liegt:
+    Trainingsfenster enden mindestens `gap` Zeilen (Standard: `time_horizon`) vor dem Validierungsblock,
+    Validierungsfenster liegen vollständig im Block. Die Folds sind Index-Listen, die Daten werden nicht kopiert.
+    :return: Liste von (train_indices, val_indices).
+    """
+    rows_per_setup = dataset.time_series_inputs.shape[0]
+    time_horizon = dataset.time_horizon
+    gap = time_horizon if gap is None else gap
+    positions = sample_time_positions(dataset)
+    boundaries = np.linspace(0, rows_per_setup, n_folds + 2).astype(int)
+    block_length = int(np.min(np.diff(boundaries)))
+    if time_horizon >= block_length:
+        raise ValueError(f"time_horizon={time_horizon} ist nicht kleiner als die Blocklänge von {block_length} Zeilen "
+                         f"({rows_per_setup} Zeilen je Setup, {n_folds} Folds)")
+    window_end = positions + time_horizon
+    folds = []
+    for k in range(n_folds):
+        val_start, val_end = boundaries[k + 1], boundaries[k + 2]
+        train_start = 0 if mode == "expanding" else boundaries[max(0, k + 1 - window_blocks)]
+        train_indices = np.where((positions >= train_start) & (window_end <= val_start - gap))[0]
+        val_indices = np.where((positions >= val_start) & (window_end <= val_end))[0]
+        folds.append((train_indices, val_indices))
+    return folds
+
+
+def _init_worker(dataset, n_threads):
+    global _dataset
+    _dataset = dataset
+    torch.set_num_threads(n_threads)
+
+
+def _run_fold(fold, train_indices, val_indices, config, cv_dir):
+    torch.manual_seed(config.get("seed", 0))
+    model = build_model(config, input_dim=_dataset.input_dim())
+    fold_config = dict(config, final_evaluation=False)
+    _, val_losses, best_val_loss, _ = train_and_optimize(Subset(_dataset, train_indices), Subset(_dataset, val_indices),
+                                                         Path(cv_dir) / f"fold_{fold}", model, fold_config)
+    return {"fold": fold, "n_train": len(train_indices), "n_val": len(val_indices),
+            "best_val_loss": best_val_loss, "val_losses": [float(v) for v in val_losses]}
+
+
+def cross_validate(dataset, config, cv_dir, n_folds=4, mode="expanding", window_blocks=1, gap=None, n_workers=None):
+    """
+    Trainiert alle Folds parallel in Worker-Prozessen und berichtet den L1-Verlust je Fold und aggregiert.
+    """
+    cv_dir = Path(cv_dir)
+    cv_dir.mkdir(parents=True, exist_ok=True)
+    folds = rolling_origin_folds(dataset, n_folds=n_folds, mode=mode, window_blocks=window_blocks, gap=gap)
+    for fold, (train_indices, val_indices) in enumerate(folds):
+        if min(len(train_indices), len(val_indices)) < config["batch_size"]:
+            raise ValueError(f"Fold {fold} hat weniger Samples ({len(train_indices)} train, {len(val_indices)} val) "
+                             f"als batch_size={config['batch_size']}")
+
+    n_workers = n_workers or min(n_folds, os.cpu_count() or 1)
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(dataset, n_threads)) as pool:
+        futures = [pool.submit(_run_fold, fold, train_indices, val_indices, config, cv_dir)
+                   for fold, (train_indices, val_indices) in enumerate(folds)]
+        fold_results = [future.result() for future in futures]
+
+    losses = np.array([result["best_val_loss"] for result in fold_results])
+    results = {"mode": mode, "n_folds": n_folds, "folds": fold_results,
+               "mean_val_loss": float(losses.mean()), "std_val_loss": float(losses.std())}
+    for result in fold_results:
+        logging.warning(f"Fold {result['fold']}: {result['n_train']} train / {result['n_val']} val Samples, "
+                        f"Val Loss = {result['best_val_loss']:.4f}")
+    logging.warning(f"Cross-Validation ({mode}): Val Loss = {results['mean_val_loss']:.4f} +- {results['std_val_loss']:.4f}")
+    with open(cv_dir / "cv_results.json", "w") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    config = {
+        "batch_size": 8,
+        "epochs": 3,
+        # Fenster müssen kürzer als ein Block der Zeitachse sein (101 Zeilen je Setup / 4 Blöcke)
+        "time_horizon": 10,
+        "n_layers": 5,
+        "batch_norm": False,
+        "dropout": 0.5,
+        "learning_rate": 0.001,
+        "kernel_size": 3,
+        "pool": False,
+        "test_run": True,
+        "seed": 0,
+    }
+    dataset = HAST_Dataset(time_horizon=config["time_horizon"], split="dummy")
+    cross_validate(dataset, config, Path("../experiments") / "CV_with_dummy_data", n_folds=3, mode="expanding")
@@ -1,10 +1,22 @@
+import hashlib
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, Subset
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from sklearn.preprocessing import MinMaxScaler
 
+# Spalten der Input-Dateien, die nicht als Features verwendet werden
+DROPPED_INPUT_COLUMNS = ["mbc60Slp", "mbr1003RaumsollTagHk1", "interpPowerWODHW", "interpFlowWODHW"]
+
+
+def n_input_features(columns, n_param_columns=2):
+    """Anzahl der Modell-Inputs für eine Input-Datei mit den Spalten `columns`, aufbereitet wie in `HAST_Dataset`."""
+    features = [column for column in columns if column not in DROPPED_INPUT_COLUMNS + ["time", "timeVec"]]
+    # Zeitstempel werden durch time_sin und time_cos ersetzt
+    return len(features) + 2 + n_param_columns
+
+
 def import_data(time_horizon,test_run = False):
     if test_run:
         train_dataset = HAST_Dataset(split = "dummy", time_horizon= time_horizon)
@@ -18,13 +30,28 @@ def import_data(time_horizon,test_run = False):
     return train_dataset, val_dataset, test_dataset
 
 
+def dataset_content_hash(dataset):
+    """SHA-256 über den Inhalt eines Datensatzes; bei einem `Subset` inklusive der gewählten Indizes."""
+    if isinstance(dataset, Subset):
+        digest = hashlib.sha256(dataset_content_hash(dataset.dataset).encode())
+        digest.update(np.asarray(dataset.indices, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+    return dataset.content_hash()
+
+
+def datasets_content_hash(*datasets):
+    """Gemeinsamer Hash mehrerer Datensätze (z. B. Training und Validierung), abhängig von der Reihenfolge."""
+    return hashlib.sha256("".join(dataset_content_hash(dataset) for dataset in datasets).encode()).hexdigest()
+
+
 class HAST_Dataset(Dataset):
-    def __init__(self, time_horizon, split = "dummy"):
+    def __init__(self, time_horizon, split = "dummy", root = None):
         """
         Initialize the dataset. This is where you can load or prepare your data.
+        `root` ist das Datenverzeichnis (Standard: `data` im Repository), z. B. je Hausstation.
         """
         super().__init__()
-        root = Path(__file__).parent.parent.resolve()/"data"
+        root = Path(root) if root is not None else Path(__file__).parent.parent.resolve()/"data"
         param_file = root/"dummy_setUp.csv"
         self.regelparams = pd.read_csv(param_file)[["Steigung", "Level"]]
         self.time_horizon = time_horizon
@@ -47,7 +74,7 @@ class HAST_Dataset(Dataset):
         targets_orinigal = original_targets.drop(columns=["timeVec"])
 
         #hours only
-        inputs = original_inputs.drop(columns=["mbc60Slp","mbr1003RaumsollTagHk1", "interpPowerWODHW", "interpFlowWODHW"])
+        inputs = original_inputs.drop(columns=DROPPED_INPUT_COLUMNS)
         inputs["timeVec"] = pd.to_datetime(original_inputs["time"], format="%d-%b-%Y %H:%M:%S", errors='coerce')
         inputs["hour"] = inputs["timeVec"].dt.hour
         inputs["minute"] = inputs["timeVec"].dt.minute
@@ -58,11 +85,20 @@ class HAST_Dataset(Dataset):
 
         inputs.loc[inputs["mbr106BetriebsartHk1"] == "4,5", "mbr106BetriebsartHk1"] = "Nacht"
         inputs["mbr106BetriebsartHk1"] = inputs["mbr106BetriebsartHk1"].map({"Tag": 1, "Nacht": 0})
+        # Unskalierte Außentemperatur und Betriebsart je Zeitschritt (z. B. für Regelparameter-Fahrpläne)
+        self.outdoor_temperature = inputs["mbr10AussentemperaturAf1"].to_numpy(dtype=np.float64)
+        self.betriebsart = inputs["mbr106BetriebsartHk1"].to_numpy(dtype=np.float64)
+        # Unskalierter Vorlauf- und Raumsollwert (Referenz für die Komfortbewertung)
+        self.supply_setpoint = inputs["mbr1000VorlaufsollwertHk1"].to_numpy(dtype=np.float64)
+        self.room_setpoint = inputs["mbr1005RaumsollAktuellHk1"].to_numpy(dtype=np.float64)
 
         # Min Max Scaling
         self.time_series_inputs = inputs.to_numpy()
         scaler_inputs = MinMaxScaler()
         self.time_series_inputs = scaler_inputs.fit_transform(self.time_series_inputs)
+        # Spaltennamen der Modell-Inputs (Regelparameter zuletzt) und Skalierung, z. B. für Sensitivitätsanalysen
+        self.input_columns = list(inputs.columns) + list(self.regelparams.columns)
+        self.scaler_inputs = scaler_inputs
 
 
         self.regelparams = self.regelparams.to_numpy()
@@ -82,8 +118,44 @@ class HAST_Dataset(Dataset):
     def output_dim(self):
         return 1
 
+    def content_hash(self):
+        """SHA-256 über die aufbereiteten Inputs, Targets und den Zeithorizont (wird nach dem ersten Aufruf gemerkt)."""
+        if getattr(self, "_content_hash", None) is None:
+            digest = hashlib.sha256(str(self.time_horizon).encode())
+            digest.update(np.ascontiguousarray(self.final_inputs, dtype=np.float64).tobytes())
+            digest.update(np.ascontiguousarray(self.flattened_targets, dtype=np.float64).tobytes())
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
+    def inputs_for_regelparams(self, regelparams):
+        """
+        Erzeugt die Modell-Inputs des gesamten Datensatzes für eine oder mehrere Regelparameter-Kombinationen.
+        Die Zeitreihen-Inputs bleiben unverändert, nur die Regelparameter-Spalten werden ersetzt.
+        :param regelparams: Array der Form (n_params, 2) bzw. (2,) mit Steigung und Level.
+        :return: Array der Form (n_params * len(self), time_horizon, input_dim).
+        """
+        n_param_columns = self.regelparams.shape[1]
+        regelparams = np.asarray(regelparams, dtype=np.float32).reshape(-1, n_param_columns)
+        n_rows = len(self) * self.time_horizon
+        inputs = np.repeat(self.final_inputs[np.newaxis, :n_rows].astype(np.float32), regelparams.shape[0], axis=0)
+        inputs[:, :, -n_param_columns:] = regelparams[:, np.newaxis, :]
+        return inputs.reshape(-1, self.time_horizon, self.input_dim())
 
 
+    def inputs_for_schedule(self, schedules):
+        """
+        Wie `inputs_for_regelparams`, aber mit Regelparametern je Zeitschritt der Zeitreihe (Fahrplan).
+        :param schedules: Array der Form (n_schedules, n_zeitschritte, 2), wird über alle Setups wiederholt.
+        :return: Array der Form (n_schedules * len(self), time_horizon, input_dim).
+        """
+        n_param_columns = self.regelparams.shape[1]
+        schedules = np.asarray(schedules, dtype=np.float32).reshape(-1, self.time_series_inputs.shape[0], n_param_columns)
+        n_rows = len(self) * self.time_horizon
+        row_positions = np.arange(n_rows) % self.time_series_inputs.shape[0]
+        inputs = np.repeat(self.final_inputs[np.newaxis, :n_rows].astype(np.float32), schedules.shape[0], axis=0)
+        inputs[:, :, -n_param_columns:] = schedules[:, row_positions, :]
+        return inputs.reshape(-1, self.time_horizon, self.input_dim())
+
     def __getitem__(self, idx):
         """
         Retrieve a sample (N tim steps) by index.
@@ -0,0 +1,172 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset, DataLoader
+
+from dataset import HAST_Dataset
+from models import MLPModel, CNNModel
+from optimze_regel_params import predict_outputs_for_regelparams
+from utils import best_checkpoint_path, setup_logging, count_parameters, model_size_bytes, measure_latency
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def sample_regelparam_grid(dataset, n_steigung=16, n_level=15):
+    """Dichtes, gleichmäßiges Gitter über den Wertebereich von Steigung und Level im Datensatz."""
+    min_params = np.min(dataset.regelparams, axis=0)
+    max_params = np.max(dataset.regelparams, axis=0)
+    steigung = np.linspace(min_params[0], max_params[0], n_steigung)
+    level = np.linspace(min_params[1], max_params[1], n_level)
+    return np.array(np.meshgrid(steigung, level, indexing="ij")).reshape(2, -1).T.astype(np.float32)
+
+
+def sample_regelparam_random(dataset, n_samples, seed=0):
+    """Zufällige Regelparameter-Kombinationen innerhalb des Wertebereichs im Datensatz."""
+    rng = np.random.default_rng(seed)
+    min_params = np.min(dataset.regelparams, axis=0)
+    max_params = np.max(dataset.regelparams, axis=0)
+    return rng.uniform(min_params, max_params, size=(n_samples, len(min_params))).astype(np.float32)
+
+
+class TeacherDataset(Dataset):
+    """
+    Datensatz aus Lehrer-Vorhersagen über ein Gitter von Regelparametern.
+
+    Die Inputs werden pro Sample aus dem Basis-Datensatz erzeugt, es werden nur die Lehrer-Outputs vorgehalten.
+    """
+    def __init__(self, base_dataset, regelparams_grid, teacher_outputs):
+        super().__init__()
+        self.base_dataset = base_dataset
+        self.regelparams_grid = regelparams_grid
+        self.teacher_outputs = teacher_outputs.reshape(len(regelparams_grid) * len(base_dataset), -1)
+
+    def __len__(self):
+        return len(self.regelparams_grid) * len(self.base_dataset)
+
+    def __getitem__(self, idx):
+        param_idx, sample_idx = divmod(idx, len(self.base_dataset))
+        start_idx = sample_idx * self.base_dataset.time_horizon
+        end_idx = start_idx + self.base_dataset.time_horizon
+        inputs = np.array(self.base_dataset.final_inputs[start_idx:end_idx], dtype=np.float32)
+        inputs[:, -self.regelparams_grid.shape[1]:] = self.regelparams_grid[param_idx]
+        return torch.from_numpy(inputs), torch.tensor(self.teacher_outputs[idx], dtype=torch.float)
+
+
+def build_student(kind, dataset, config):
+    """Erzeugt ein kompaktes Schüler-Modell ("mlp" oder "cnn")."""
+    time_horizon = dataset.time_horizon
+    if kind == "mlp":
+        return MLPModel(input_dim=dataset.input_dim(), hidden_dims=config.get("student_hidden_dims", [64, 32]),
+                        output_dim=time_horizon, dropout_rate=config.get("student_dropout", 0.1),
+                        sequence_length=time_horizon)
+    if kind == "cnn":
+        return CNNModel(input_features=dataset.input_dim(), sequence_length=time_horizon,
+                        dropout_rate=config.get("student_dropout", 0.1), n_layers=2, batch_norm=False,
+                        kernel_size=3, pad=1, size_out=time_horizon, pool=True,
+                        channels=config.get("student_channels", [16, 16]))
+    raise ValueError(f"Unbekannter Schüler-Typ: {kind}")
+
+
+def train_student(student, teacher_dataset, config):
+    """Trainiert den Schüler mit L1Loss auf die Lehrer-Vorhersagen."""
+    loader = DataLoader(teacher_dataset, batch_size=config.get("student_batch_size", 256), shuffle=True, drop_last=True)
+    criterion = nn.L1Loss()
+    optimizer = torch.optim.Adam(student.parameters(), lr=config.get("student_learning_rate", 1e-3))
+    student.to(device)
+    losses = []
+    for epoch in range(config.get("student_epochs", 10)):
+        student.train()
+        total_loss = 0
+        for inputs, targets in loader:
+            inputs, targets = inputs.to(device), targets.to(device)
+            optimizer.zero_grad()
+            loss = criterion(student(inputs), targets)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+        losses.append(total_loss / len(loader))
+        logging.warning(f"Distillation Epoch {epoch + 1}: Student-Teacher L1 = {losses[-1]:.4f}")
+    return losses
+
+
+def l1_on_dataset(model, dataset):
+    """L1-Fehler eines Modells gegenüber den echten Targets des Datensatzes."""
+    loader = DataLoader(dataset, batch_size=len(dataset), shuffle=False)
+    model.eval()
+    model.to(device)
+    total_loss = 0
+    with torch.no_grad():
+        for inputs, targets in loader:
+            outputs = model(inputs.to(device))
+            total_loss += torch.mean(torch.abs(outputs.squeeze() - targets.to(device))).item()
+    return total_loss / len(loader)
+
+
+def distill(teacher, train_dataset, val_dataset, config, kind="mlp", root=None):
+    """
+    Destilliert den Lehrer (z. B. das trainierte CNN) in ein kompaktes Schüler-Modell.
+
+    Der Schüler wird auf den Lehrer-Vorhersagen über ein dichtes Regelparameter-Gitter trainiert. Bewertet werden
+    der Fehler gegenüber dem Lehrer auf zufälligen, ungesehenen Regelparametern des Validierungsdatensatzes,
+    der Fehler gegenüber den echten Targets sowie Latenz und Modellgröße.
+    """
+    teacher.eval()
+    grid = sample_regelparam_grid(train_dataset, config.get("n_steigung", 16), config.get("n_level", 15))
+    logging.warning(f"Berechne Lehrer-Vorhersagen für {len(grid)} Regelparameter-Kombinationen")
+    teacher_outputs = predict_outputs_for_regelparams(teacher, train_dataset, grid)
+
+    student = build_student(kind, train_dataset, config)
+    train_student(student, TeacherDataset(train_dataset, grid, teacher_outputs), config)
+    student.eval()
+
+    eval_params = sample_regelparam_random(val_dataset, config.get("n_eval_params", 32))
+    teacher_eval = predict_outputs_for_regelparams(teacher, val_dataset, eval_params)
+    student_eval = predict_outputs_for_regelparams(student, val_dataset, eval_params)
+
+    example_inputs = torch.from_numpy(val_dataset.inputs_for_regelparams(eval_params[0])).to(device)
+    teacher_latency = measure_latency(teacher, example_inputs)
+    student_latency = measure_latency(student, example_inputs)
+    report = {
+        "student": kind,
+        "n_grid_params": int(len(grid)),
+        "student_teacher_l1": float(np.mean(np.abs(student_eval - teacher_eval))),
+        "teacher_target_l1": l1_on_dataset(teacher, val_dataset),
+        "student_target_l1": l1_on_dataset(student, val_dataset),
+        "teacher_latency_ms": teacher_latency,
+        "student_latency_ms": student_latency,
+        "latency_reduction": teacher_latency / student_latency,
+        "teacher_parameters": count_parameters(teacher),
+        "student_parameters": count_parameters(student),
+        "teacher_size_bytes": model_size_bytes(teacher),
+        "student_size_bytes": model_size_bytes(student),
+    }
+    report["size_reduction"] = report["teacher_size_bytes"] / report["student_size_bytes"]
+    logging.warning(f"Distillation Report: {report}")
+
+    if root is not None:
+        root = Path(root)
+        torch.save(student.state_dict(), root / f"student_{kind}.pt")
+        with open(root / f"distillation_{kind}.json", "w") as f:
+            json.dump(report, f)
+    return student, report
+
+
+if __name__ == "__main__":
+    setup_logging()
+    root = Path("../experiments/Test_Run_with_dummy_data/")
+    directory = root/"CNN/"
+    with open(root/"config.json", "r") as f:
+        config = json.load(f)
+
+    teacher = CNNModel(sequence_length=config["time_horizon"],n_layers = config["n_layers"], batch_norm = config["batch_norm"],
+                       dropout_rate= config["dropout"], kernel_size=config["kernel_size"], size_out=config["time_horizon"],
+                       pool=config["pool"])
+    teacher.load_state_dict(torch.load(best_checkpoint_path(directory)))
+
+    train_dataset = HAST_Dataset(time_horizon=config["time_horizon"], split="dummy")
+    val_dataset = HAST_Dataset(time_horizon=config["time_horizon"], split="dummy_val")
+    for kind in ["mlp", "cnn"]:
+        distill(teacher, train_dataset, val_dataset, config, kind=kind, root=directory)
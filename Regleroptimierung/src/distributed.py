@@ -0,0 +1,76 @@
+import logging
+import os
+
+import torch
+import torch.distributed as dist
+
+
+def init_distributed():
+    """
+    Initialisiert das verteilte Training (gloo-Backend), wenn das Skript über torchrun gestartet wurde.
+
+    torchrun setzt RANK, WORLD_SIZE, MASTER_ADDR und MASTER_PORT. Ohne diese Variablen läuft das Training
+    wie bisher in einem einzelnen Prozess.
+    """
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1 or dist.is_initialized():
+        return is_distributed()
+    dist.init_process_group(backend="gloo")
+    # Jeder Prozess teilt sich die Kerne mit den anderen Prozessen auf demselben Knoten
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    logging.warning(f"Verteiltes Training: Rank {get_rank()} von {get_world_size()}")
+    return True
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    """Nur Rank 0 schreibt Checkpoints, Vorhersagen und Ergebnisse."""
+    return get_rank() == 0
+
+
+def reduce_mean(value):
+    """Mittelt einen skalaren Wert (z. B. den Trainingsverlust) über alle Prozesse."""
+    if not is_distributed():
+        return value
+    tensor = torch.tensor(float(value), dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.item() / get_world_size()
+
+
+def all_reduce_mean(total, count):
+    """Mittelwert über alle Prozesse aus lokalen Summen und Anzahlen (z. B. Verlustsumme und Anzahl der Batches)."""
+    if not is_distributed():
+        return total / max(count, 1)
+    tensor = torch.tensor([float(total), float(count)], dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return (tensor[0] / tensor[1].clamp(min=1)).item()
+
+
+def broadcast_object(obj):
+    """Verteilt ein Python-Objekt von Rank 0 an alle Prozesse, damit z. B. Abbruchentscheidungen einheitlich sind."""
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def cleanup_distributed():
+    if is_distributed():
+        dist.destroy_process_group()
@@ -0,0 +1,190 @@
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Erlaubte Konfigurationsschlüssel in `compare_runs` (werden als Spaltennamen verwendet)
+CONFIG_KEY_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    experiment_group TEXT,
+    experiments_dir TEXT NOT NULL,
+    model TEXT,
+    config TEXT NOT NULL,
+    data_hash TEXT,
+    seed INTEGER,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    n_epochs INTEGER DEFAULT 0,
+    best_epoch INTEGER,
+    best_val_loss REAL,
+    test_loss REAL,
+    best_checkpoint TEXT,
+    wall_time_s REAL,
+    optimized_params TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_group ON runs (experiment_group, best_val_loss);
+CREATE INDEX IF NOT EXISTS idx_runs_data_hash ON runs (data_hash);
+CREATE INDEX IF NOT EXISTS idx_runs_dir ON runs (experiments_dir, started_at);
+CREATE INDEX IF NOT EXISTS idx_runs_best_val_loss ON runs (best_val_loss);
+
+CREATE TABLE IF NOT EXISTS epochs (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    epoch INTEGER NOT NULL,
+    train_loss REAL,
+    val_loss REAL,
+    learning_rate REAL,
+    elapsed_s REAL,
+    samples_per_s REAL,
+    PRIMARY KEY (run_id, epoch)
+);
+
+CREATE TABLE IF NOT EXISTS stage_timings (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    calls INTEGER,
+    total_s REAL,
+    samples INTEGER,
+    PRIMARY KEY (run_id, stage)
+);
+"""
+
+
+class ExperimentStore:
+    """
+    Lokale SQLite-Datenbank für Experimente: Konfiguration, Daten-Hash, Metriken je Epoche, Laufzeiten,
+    bester Checkpoint und Ergebnisse der Regelparameter-Optimierung je Lauf.
+
+    Die Datenbank läuft im WAL-Modus, damit mehrere Worker-Prozesse (z. B. eines Sweeps) gleichzeitig schreiben
+    können. Die Konfiguration wird als JSON gespeichert und lässt sich mit `json_extract` direkt abfragen.
+    """
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def start_run(self, experiments_dir, config, data_hash=None, model=None, resume=False):
+        """
+        Legt einen Lauf an und gibt dessen `run_id` zurück. Beim Fortsetzen (`resume=True`) wird der letzte Lauf
+        desselben Verzeichnisses weitergeführt, statt einen neuen anzulegen.
+        """
+        experiments_dir = str(experiments_dir)
+        if resume:
+            row = self.connection.execute("SELECT run_id FROM runs WHERE experiments_dir = ? ORDER BY started_at DESC "
+                                          "LIMIT 1", (experiments_dir,)).fetchone()
+            if row is not None:
+                with self.connection:
+                    self.connection.execute("UPDATE runs SET status = 'running', config = ?, finished_at = NULL "
+                                            "WHERE run_id = ?", (json.dumps(config), row[0]))
+                return row[0]
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (experiment_group, experiments_dir, model, config, data_hash, seed, status, started_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'running', ?)",
+                (config.get("experiment_group"), experiments_dir, model, json.dumps(config), data_hash,
+                 config.get("seed"), time.time()))
+        return cursor.lastrowid
+
+    def log_epoch(self, run_id, epoch, train_loss, val_loss, learning_rate=None, elapsed_s=None, samples_per_s=None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO epochs (run_id, epoch, train_loss, val_loss, learning_rate, elapsed_s, "
+                "samples_per_s) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, epoch, float(train_loss), float(val_loss), learning_rate, elapsed_s, samples_per_s))
+            self.connection.execute(
+                "UPDATE runs SET n_epochs = (SELECT COUNT(*) FROM epochs WHERE run_id = ?) WHERE run_id = ?",
+                (run_id, run_id))
+
+    def finish_run(self, run_id, status="finished", best_checkpoint=None, test_loss=None, wall_time_s=None,
+                   optimized_params=None, stage_timings=None):
+        """
+        Schließt einen Lauf ab. Bester Epoch und Validierungsverlust werden aus den protokollierten Epochen bestimmt,
+        `stage_timings` ist das `stages`-Dict eines `RunProfiler`.
+        """
+        with self.connection:
+            best = self.connection.execute("SELECT epoch, val_loss FROM epochs WHERE run_id = ? ORDER BY val_loss "
+                                           "LIMIT 1", (run_id,)).fetchone() or (None, None)
+            self.connection.execute(
+                "UPDATE runs SET status = ?, finished_at = ?, best_epoch = ?, best_val_loss = ?, test_loss = ?, "
+                "best_checkpoint = ?, wall_time_s = ?, optimized_params = ? WHERE run_id = ?",
+                (status, time.time(), best[0], best[1], None if test_loss is None else float(test_loss),
+                 None if best_checkpoint is None else str(best_checkpoint), wall_time_s,
+                 None if optimized_params is None else json.dumps(optimized_params, default=float), run_id))
+            for stage, timing in (stage_timings or {}).items():
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO stage_timings (run_id, stage, calls, total_s, samples) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, stage, timing["calls"], timing["total_s"], timing["samples"]))
+
+    def runs(self, experiment_group=None, data_hash=None, status=None):
+        """Alle Läufe (optional gefiltert), sortiert nach bestem Validierungsverlust."""
+        conditions, params = [], []
+        for column, value in (("experiment_group", experiment_group), ("data_hash", data_hash), ("status", status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return pd.read_sql_query(f"SELECT * FROM runs {where} ORDER BY best_val_loss", self.connection, params=params)
+
+    def compare_runs(self, config_keys, experiment_group=None, limit=None):
+        """
+        Eine Abfrage für den Vergleich vieler Läufe: je Lauf die gewählten Konfigurationswerte, bester Val-Loss,
+        Test-Loss, Epochen und Laufzeit, sortiert nach bestem Validierungsverlust.
+        Schlüssel müssen Bezeichner sein (verschachtelt mit Punkt, z. B. "optimizer.lr"); der JSON-Pfad wird als
+        Parameter gebunden.
+        """
+        config_keys = list(config_keys)
+        for key in config_keys:
+            if not CONFIG_KEY_PATTERN.fullmatch(key):
+                raise ValueError(f"Ungültiger Konfigurationsschlüssel: {key!r}")
+        columns = ", ".join(f"json_extract(config, ?) AS \"{key}\"" for key in config_keys)
+        query = (f"SELECT run_id, experiment_group, {columns + ',' if columns else ''} best_val_loss, test_loss, n_epochs, "
+                 f"wall_time_s, status FROM runs")
+        params = [f"$.{key}" for key in config_keys]
+        if experiment_group is not None:
+            query += " WHERE experiment_group = ?"
+            params.append(experiment_group)
+        query += " ORDER BY best_val_loss"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(query, self.connection, params=params)
+
+    def epoch_metrics(self, run_ids=None):
+        """Metriken je Epoche für die gewählten Läufe (bzw. alle) in langer Form."""
+        query = "SELECT * FROM epochs"
+        params = []
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            query += f" WHERE run_id IN ({', '.join('?' for _ in run_ids)})"
+            params = run_ids
+        return pd.read_sql_query(query + " ORDER BY run_id, epoch", self.connection, params=params)
+
+    def stage_timings(self, run_ids=None):
+        query = "SELECT * FROM stage_timings"
+        params = []
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            query += f" WHERE run_id IN ({', '.join('?' for _ in run_ids)})"
+            params = run_ids
+        return pd.read_sql_query(query + " ORDER BY run_id, stage", self.connection, params=params)
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    # Übersicht über alle Läufe einer Datenbank, z. B. python experiment_store.py ../experiments/experiments.db n_layers
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "../experiments/experiments.db"
+    store = ExperimentStore(db_path)
+    print(store.compare_runs(sys.argv[2:]).to_string())
+    store.close()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pandas as pd
+import torch
+
+from dataset import HAST_Dataset, n_input_features
+from models import build_model
+from optimze_regel_params import adaptive_grid_search, bayesian_optimize_regelparams
+from utils import atomic_write, best_checkpoint_path
+
+SUMMARY_NAME = "fleet_summary.csv"
+SUMMARY_COLUMNS = ["station", "status", "best_m", "best_l", "ruecklauftemp", "n_evaluations", "checkpoint_hash",
+                   "memory_estimate_mb", "duration_s", "finished_at", "error"]
+
+
+def discover_stations(fleet_dir):
+    """
+    Findet alle Hausstationen unterhalb von `fleet_dir`.
+
+    Eine Station ist ein Verzeichnis mit `config.json` (wie von `training.py` geschrieben) und genau einem
+    Modellverzeichnis mit Checkpoint-Manifest (`*/checkpoints.json`). Die Daten liegen in `data/` der Station,
+    sonst unter `config["data_root"]` bzw. im Standard-Datenverzeichnis.
+    """
+    stations = []
+    for config_path in sorted(Path(fleet_dir).glob("*/config.json")):
+        station_dir = config_path.parent
+        manifests = sorted(station_dir.glob("*/checkpoints.json"))
+        if len(manifests) != 1:
+            logging.warning(f"{station_dir.name}: {len(manifests)} Modellverzeichnisse gefunden, Station wird übersprungen")
+            continue
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        data_root = station_dir / "data" if (station_dir / "data").is_dir() else config.get("data_root")
+        stations.append({"station": station_dir.name, "station_dir": str(station_dir),
+                         "model_dir": str(manifests[0].parent), "data_root": None if data_root is None else str(data_root),
+                         "config": config})
+    return stations
+
+
+def _data_files(station, split):
+    """
+    Input- und Setup-Datei einer Station. Die Dateinamen kommen aus der Stations-Konfiguration
+    (`"input_file_pattern"` mit Platzhalter `{split}`, `"setup_file"`), Standard ist die Benennung der Dummy-Daten.
+    """
+    config = station["config"]
+    data_root = Path(station["data_root"]) if station["data_root"] is not None else \
+        Path(__file__).parent.parent.resolve() / "data"
+    input_file = config.get("input_file_pattern", "dummy_{split}_inputs.csv").format(split=split)
+    return data_root / input_file, data_root / config.get("setup_file", "dummy_setUp.csv")
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f) - 1
+
+
+def estimate_memory_bytes(station, params_per_pass=8):
+    """
+    Grobe Abschätzung des Speicherbedarfs einer Stations-Optimierung: replizierte Inputs des Datensatzes
+    (Zeitschritte x Setups, float64), die gebatchten Modell-Inputs (float32) und das Modell.
+    """
+    split = optimization_split(station["config"])
+    inputs_file, setup_file = _data_files(station, split)
+    rows = _count_lines(inputs_file) * _count_lines(setup_file)
+    n_features = n_input_features(pd.read_csv(inputs_file, nrows=0).columns)
+    dataset_bytes = rows * n_features * 8 * 2
+    batch_bytes = params_per_pass * rows * n_features * 4 * 2
+    model_bytes = 3 * best_checkpoint_path(station["model_dir"]).stat().st_size
+    return dataset_bytes + batch_bytes + model_bytes
+
+
+def optimization_split(config):
+    return config.get("optimization_split", "dummy_val" if config.get("test_run", True) else "test")
+
+
+def _checkpoint_hash(station):
+    return hashlib.sha256(best_checkpoint_path(station["model_dir"]).read_bytes()).hexdigest()
+
+
+def _init_worker(n_threads):
+    torch.set_num_threads(n_threads)
+
+
+def _new_pool(n_workers, n_threads):
+    return ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(n_threads,))
+
+
+def optimize_station(station, method="adaptive", params_per_pass=8):
+    """Lädt Modell und Datensatz einer Station und bestimmt die empfohlenen Regelparameter."""
+    start = time.monotonic()
+    config = station["config"]
+    dataset = HAST_Dataset(time_horizon=config["time_horizon"], split=optimization_split(config),
+                           root=station["data_root"])
+    model = build_model(config, input_dim=dataset.input_dim())
+    model.load_state_dict(torch.load(best_checkpoint_path(station["model_dir"]), map_location="cpu"))
+    model.eval()
+    bounds = list(zip(dataset.regelparams.min(axis=0), dataset.regelparams.max(axis=0)))
+    mixed_precision = config.get("mixed_precision", False)
+    if method == "adaptive":
+        result = adaptive_grid_search(model, dataset, bounds, params_per_pass=params_per_pass,
+                                      mixed_precision=mixed_precision)
+    elif method == "bayes":
+        result = bayesian_optimize_regelparams(model, dataset, bounds, mixed_precision=mixed_precision)
+    else:
+        raise ValueError(f"Unbekannte Optimierungsmethode: {method}")
+    return {"best_m": float(result["best_params"][0]), "best_l": float(result["best_params"][1]),
+            "ruecklauftemp": float(result["best_value"]), "n_evaluations": int(result["n_evaluations"]),
+            "duration_s": time.monotonic() - start}
+
+
+def _write_summary(rows, output_dir):
+    summary = pd.DataFrame(list(rows.values()), columns=SUMMARY_COLUMNS).sort_values("station")
+    atomic_write(Path(output_dir) / SUMMARY_NAME, lambda f: summary.to_csv(f, index=False), mode="w")
+    return summary
+
+
+def run_fleet(fleet_dir, output_dir=None, memory_budget_gb=4.0, n_workers=None, method="adaptive", params_per_pass=8):
+    """
+    Optimiert die Regelparameter aller gefundenen Stationen in einem Prozess-Pool.
+
+    Es laufen höchstens `n_workers` Stationen gleichzeitig und nur so viele, dass die Summe ihres geschätzten
+    Speicherbedarfs `memory_budget_gb` nicht übersteigt (eine einzelne größere Station läuft allein). Fehler
+    einer Station werden in der Zusammenfassung vermerkt, ohne die anderen zu beeinflussen; bricht ein Worker-Prozess
+    ab (z. B. durch den OOM-Killer), werden nur die Stationen im zerbrochenen Pool als fehlgeschlagen markiert und der
+    Pool wird neu aufgebaut. Die Tabelle
+    `fleet_summary.csv` wird nach jeder Station geschrieben; ein erneuter Aufruf überspringt Stationen, die mit
+    unverändertem Checkpoint bereits erfolgreich optimiert wurden, und wiederholt fehlgeschlagene.
+    """
+    output_dir = Path(output_dir) if output_dir is not None else Path(fleet_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rows = {}
+    if (output_dir / SUMMARY_NAME).exists():
+        previous = pd.read_csv(output_dir / SUMMARY_NAME)
+        rows = {row["station"]: row for row in previous.to_dict("records")}
+
+    pending = []
+    for station in discover_stations(fleet_dir):
+        name = station["station"]
+        try:
+            station["checkpoint_hash"] = _checkpoint_hash(station)
+            station["memory_estimate"] = estimate_memory_bytes(station, params_per_pass)
+        except Exception as e:
+            logging.error(f"{name}: Station kann nicht vorbereitet werden: {e}")
+            rows[name] = {"station": name, "status": "failed", "error": str(e), "finished_at": time.time()}
+            continue
+        previous = rows.get(name)
+        if previous is not None and previous["status"] == "ok" and previous["checkpoint_hash"] == station["checkpoint_hash"]:
+            continue
+        pending.append(station)
+    logging.warning(f"Flotten-Optimierung: {len(pending)} Stationen offen, {len(rows)} bereits in der Zusammenfassung")
+
+    memory_budget = memory_budget_gb * 1024 ** 3
+    n_workers = n_workers or os.cpu_count() or 1
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    # Große Stationen zuerst, damit kleine die Lücken im Speicherbudget füllen
+    pending.sort(key=lambda station: station["memory_estimate"], reverse=True)
+    # Future -> (Station, Generation des Pools); nach einem Absturz eines Workers wird der Pool neu aufgebaut
+    running = {}
+    generation = 0
+    pool = _new_pool(n_workers, n_threads)
+    try:
+        while pending or running:
+            memory_in_use = sum(station["memory_estimate"] for station, _ in running.values())
+            for station in list(pending):
+                if len(running) >= n_workers:
+                    break
+                if running and memory_in_use + station["memory_estimate"] > memory_budget:
+                    continue
+                if station["memory_estimate"] > memory_budget:
+                    logging.warning(f"{station['station']}: geschätzter Speicherbedarf über dem Budget, läuft allein")
+                try:
+                    future = pool.submit(optimize_station, station, method, params_per_pass)
+                except BrokenProcessPool:
+                    # Der Pool ist seit der letzten Runde zerbrochen; betroffene Stationen melden das über ihr Future
+                    pool.shutdown(wait=False)
+                    pool, generation = _new_pool(n_workers, n_threads), generation + 1
+                    future = pool.submit(optimize_station, station, method, params_per_pass)
+                pending.remove(station)
+                running[future] = (station, generation)
+                memory_in_use += station["memory_estimate"]
+                if memory_in_use >= memory_budget:
+                    break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                station, station_generation = running.pop(future)
+                row = {"station": station["station"], "checkpoint_hash": station["checkpoint_hash"],
+                       "memory_estimate_mb": station["memory_estimate"] / 1024 ** 2, "finished_at": time.time()}
+                try:
+                    row.update(future.result(), status="ok", error=None)
+                    logging.warning(f"{station['station']}: Steigung {row['best_m']:.3f}, Level {row['best_l']:.3f}, "
+                                    f"Rücklauftemperatur {row['ruecklauftemp']:.4f}")
+                except BrokenProcessPool as e:
+                    # Ein Worker wurde beendet (z. B. vom OOM-Killer); betroffen sind die Stationen dieses Pools
+                    logging.error(f"{station['station']}: Worker-Prozess abgebrochen: {e}")
+                    row.update(status="failed", error=f"Worker-Prozess abgebrochen: {e}")
+                    broken = broken or station_generation == generation
+                except Exception as e:
+                    logging.error(f"{station['station']}: Optimierung fehlgeschlagen: {e}")
+                    row.update(status="failed", error=str(e))
+                rows[station["station"]] = row
+                _write_summary(rows, output_dir)
+            if broken:
+                pool.shutdown(wait=False)
+                pool, generation = _new_pool(n_workers, n_threads), generation + 1
+    finally:
+        pool.shutdown(wait=True)
+
+    return _write_summary(rows, output_dir)
+
+
+if __name__ == "__main__":
+    # Alle Stationen (Experiment-Verzeichnisse mit config.json) unter ../experiments, z. B. als nächtlicher Job
+    summary = run_fleet(Path("../experiments"), memory_budget_gb=4.0, method="adaptive")
+    print(summary.to_string())
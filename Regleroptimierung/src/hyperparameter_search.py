@@ -0,0 +1,271 @@
+import json
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from dataset import import_data
+from models import build_model
+from training import train_and_optimize
+
+# Vorbereitete Datensätze je time_horizon, werden einmal pro Worker-Prozess übergeben
+_datasets = {}
+
+
+def params_key(params, keys):
+    """Hashbarer Schlüssel einer Hyperparameter-Kombination (Werte in der Reihenfolge `keys`)."""
+    return tuple(params[key] for key in keys)
+
+
+class GridSampler:
+    """
+    Durchläuft alle Kombinationen des Suchraums in zufälliger Reihenfolge. Bereits versuchte Kombinationen
+    (`seen`) werden übersprungen; ist der Suchraum erschöpft, wird None zurückgegeben.
+    """
+    def __init__(self, search_space, seed=0):
+        self.keys = list(search_space)
+        self.grid = list(product(*search_space.values()))
+        np.random.default_rng(seed).shuffle(self.grid)
+
+    def sample(self, history, seen=frozenset()):
+        for values in self.grid:
+            if values not in seen:
+                return dict(zip(self.keys, values))
+        return None
+
+
+class RandomSampler:
+    """
+    Zieht jeden Hyperparameter gleichverteilt aus seinen Werten. Bereits versuchte Kombinationen (`seen`) werden
+    verworfen und neu gezogen; nach `max_tries` Fehlversuchen wird eine noch unbekannte Gitterkombination gewählt.
+    Ist der Suchraum erschöpft, wird None zurückgegeben.
+    """
+    def __init__(self, search_space, seed=0, max_tries=100):
+        self.search_space = search_space
+        self.keys = list(search_space)
+        self.rng = np.random.default_rng(seed)
+        self.max_tries = max_tries
+        self.fallback = GridSampler(search_space, seed=seed)
+
+    def _draw(self):
+        return {key: values[self.rng.integers(len(values))] for key, values in self.search_space.items()}
+
+    def sample(self, history, seen=frozenset()):
+        for _ in range(self.max_tries):
+            params = self._draw()
+            if params_key(params, self.keys) not in seen:
+                return params
+        return self.fallback.sample(history, seen)
+
+
+class TPESampler(RandomSampler):
+    """
+    Tree-structured Parzen Estimator für kategorische Suchräume.
+
+    Die bisherigen Trials werden am `gamma`-Quantil in gute und schlechte aufgeteilt. Je Hyperparameter werden
+    geglättete Häufigkeiten l(x) (gut) und g(x) (schlecht) geschätzt und aus `n_candidates` Ziehungen aus l
+    wird die noch nicht versuchte Kombination mit dem größten Verhältnis l(x)/g(x) gewählt. Sind alle Kandidaten
+    bereits versucht, wird wie beim `RandomSampler` eine unbekannte Kombination gezogen.
+    """
+    def __init__(self, search_space, seed=0, n_startup_trials=8, gamma=0.25, n_candidates=24):
+        super().__init__(search_space, seed=seed)
+        self.n_startup_trials = n_startup_trials
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+
+    def sample(self, history, seen=frozenset()):
+        if len(history) < self.n_startup_trials:
+            return super().sample(history, seen)
+
+        history = sorted(history, key=lambda h: h[1])
+        n_good = max(1, math.ceil(self.gamma * len(history)))
+        good, bad = history[:n_good], history[n_good:]
+
+        candidates = [{} for _ in range(self.n_candidates)]
+        scores = np.zeros(self.n_candidates)
+        for key, values in self.search_space.items():
+            good_counts = np.array([sum(params[key] == v for params, _ in good) for v in values], dtype=float) + 1
+            bad_counts = np.array([sum(params[key] == v for params, _ in bad) for v in values], dtype=float) + 1
+            l = good_counts / good_counts.sum()
+            g = bad_counts / bad_counts.sum()
+            choices = self.rng.choice(len(values), size=self.n_candidates, p=l)
+            for candidate, choice in zip(candidates, choices):
+                candidate[key] = values[choice]
+            scores += np.log(l[choices]) - np.log(g[choices])
+        for i in np.argsort(-scores):
+            if params_key(candidates[i], self.keys) not in seen:
+                return candidates[i]
+        return super().sample(history, seen)
+
+
+SAMPLERS = {"grid": GridSampler, "random": RandomSampler, "tpe": TPESampler}
+
+
+def _init_worker(datasets, n_threads):
+    global _datasets
+    _datasets = datasets
+    torch.set_num_threads(n_threads)
+
+
+def _run_trial(trial_dir, config, epochs):
+    """Trainiert (bzw. setzt fort) einen Trial bis `epochs` und gibt die Validierungsverluste zurück."""
+    train_dataset, val_dataset = _datasets[config["time_horizon"]]
+    torch.manual_seed(config.get("seed", 0))
+    model = build_model(config, input_dim=train_dataset.input_dim())
+    trial_config = dict(config, epochs=epochs, resume=True, final_evaluation=False)
+    _, val_losses, _, _ = train_and_optimize(train_dataset, val_dataset, Path(trial_dir), model, trial_config,
+                                             save_train_pred=False)
+    return [float(v) for v in val_losses]
+
+
+def run_sweep(search_space, base_config, sweep_dir, n_trials=20, sampler="random", min_epochs=1, max_epochs=27,
+              eta=3, n_workers=None, seed=0):
+    """
+    Hyperparameter-Suche mit asynchronem Successive Halving (ASHA) in einem Prozess-Pool.
+
+    Jeder Trial wird zunächst `min_epochs` Epochen trainiert. Ein Trial wird auf die nächste Stufe
+    (Epochen * `eta`, höchstens `max_epochs`) befördert, sobald er zu den besten 1/`eta` der auf seiner Stufe
+    abgeschlossenen Trials gehört; die übrigen werden früh beendet. Befördert wird durch Fortsetzen des
+    gespeicherten Trainingszustands. Die vorbereiteten Datensätze werden einmal an jeden Worker übergeben.
+    Jede Hyperparameter-Kombination wird höchstens einmal trainiert; ist der Suchraum vor `n_trials` erschöpft,
+    endet die Suche mit weniger Trials.
+
+    Alle Trials werden mit `experiment_group` = Name des Sweep-Verzeichnisses in der Experiment-Datenbank
+    (standardmäßig `sweep_dir/experiments.db`) protokolliert.
+    """
+    sweep_dir = Path(sweep_dir)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    base_config = dict(base_config, experiment_group=sweep_dir.name)
+    base_config.setdefault("experiment_db", str(sweep_dir / "experiments.db"))
+    n_workers = n_workers or os.cpu_count() or 1
+    sampler = SAMPLERS[sampler](search_space, seed=seed)
+
+    rungs = [min_epochs]
+    while rungs[-1] * eta < max_epochs:
+        rungs.append(rungs[-1] * eta)
+    if rungs[-1] < max_epochs:
+        rungs.append(max_epochs)
+
+    time_horizons = set(search_space.get("time_horizon", [base_config["time_horizon"]]))
+    datasets = {}
+    for time_horizon in time_horizons:
+        train_dataset, val_dataset, _ = import_data(time_horizon=time_horizon, test_run=base_config["test_run"])
+        datasets[time_horizon] = (train_dataset, val_dataset)
+
+    trials = []
+    rung_results = [dict() for _ in rungs]
+    promoted = [set() for _ in rungs]
+    history = []
+    keys = list(search_space)
+    exhausted = False
+
+    def next_job():
+        nonlocal exhausted
+        # Beförderungen haben Vorrang vor neuen Trials
+        for k in reversed(range(len(rungs) - 1)):
+            results = sorted(rung_results[k].items(), key=lambda item: item[1])
+            for trial_id, _ in results[:len(results) // eta]:
+                if trial_id not in promoted[k]:
+                    promoted[k].add(trial_id)
+                    return trial_id, k + 1
+        if len(trials) < n_trials and not exhausted:
+            # Bereits versuchte oder laufende Kombinationen nicht erneut trainieren
+            seen = {params_key(trial["params"], keys) for trial in trials}
+            params = sampler.sample(history, seen)
+            if params is None:
+                exhausted = True
+                logging.warning(f"Suchraum nach {len(trials)} Trials erschöpft, keine neuen Trials")
+                return None
+            trial_id = len(trials)
+            trials.append({"trial": trial_id, "params": params, "config": dict(base_config, **params),
+                           "val_losses": [], "rung": -1})
+            return trial_id, 0
+        return None
+
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    running = {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(datasets, n_threads)) as pool:
+        while True:
+            while len(running) < n_workers:
+                job = next_job()
+                if job is None:
+                    break
+                trial_id, rung = job
+                trial = trials[trial_id]
+                future = pool.submit(_run_trial, sweep_dir / f"trial_{trial_id}", trial["config"], rungs[rung])
+                running[future] = (trial_id, rung)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial_id, rung = running.pop(future)
+                trial = trials[trial_id]
+                try:
+                    trial["val_losses"] = future.result()
+                except Exception as e:
+                    logging.error(f"Trial {trial_id} fehlgeschlagen: {e}")
+                    trial["error"] = str(e)
+                    continue
+                trial["rung"] = rung
+                best_loss = float(np.min(trial["val_losses"]))
+                rung_results[rung][trial_id] = best_loss
+                history = [h for h in history if h[0] is not trial["params"]] + [(trial["params"], best_loss)]
+                logging.warning(f"Trial {trial_id} Stufe {rung} ({rungs[rung]} Epochen): Val Loss = {best_loss:.4f}")
+
+    leaderboard = write_leaderboard(trials, rungs, sweep_dir)
+    return leaderboard
+
+
+def write_leaderboard(trials, rungs, sweep_dir):
+    """Schreibt die nach bestem Validierungsverlust sortierte Rangliste aller Trials (leaderboard.csv)."""
+    rows = []
+    for trial in trials:
+        row = {"trial": trial["trial"], **trial["params"]}
+        row["epochs"] = len(trial["val_losses"])
+        row["best_val_loss"] = float(np.min(trial["val_losses"])) if trial["val_losses"] else float("nan")
+        if "error" in trial:
+            row["status"] = "failed"
+        elif trial["rung"] == len(rungs) - 1 or row["epochs"] < rungs[max(trial["rung"], 0)]:
+            row["status"] = "completed"
+        else:
+            row["status"] = "pruned"
+        rows.append(row)
+    leaderboard = pd.DataFrame(rows).sort_values("best_val_loss").reset_index(drop=True)
+    leaderboard.to_csv(Path(sweep_dir) / "leaderboard.csv", index=False)
+    logging.warning(f"Leaderboard:\n{leaderboard.head(10).to_string()}")
+    return leaderboard
+
+
+if __name__ == "__main__":
+    base_config = {
+        "batch_size": 64,
+        "time_horizon": 150,
+        "n_layers": 5,
+        "batch_norm": False,
+        "dropout": 0.5,
+        "learning_rate": 0.001,
+        "kernel_size": 5,
+        "pool": False,
+        "test_run": True,
+        "seed": 0,
+    }
+    search_space = {
+        "batch_size": [32, 64, 128],
+        "n_layers": [2, 3, 5],
+        "kernel_size": [3, 5],
+        "dropout": [0.2, 0.5],
+        "pool": [False, True],
+        "time_horizon": [100, 150],
+        "learning_rate": [1e-3, 3e-3, 1e-2],
+    }
+    sweep_dir = Path("../experiments") / "Sweep_with_dummy_data"
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    with open(sweep_dir / "search_space.json", "w") as f:
+        json.dump({"base_config": base_config, "search_space": search_space}, f)
+    run_sweep(search_space, base_config, sweep_dir, n_trials=27, sampler="tpe", min_epochs=1, max_epochs=9, eta=3)
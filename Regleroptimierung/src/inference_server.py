@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, unquote
+
+import numpy as np
+import torch
+
+from dataset import HAST_Dataset
+from fleet_optimization import discover_stations, optimization_split
+from models import build_model
+from optimze_regel_params import predict_ruecklauftemp_batch, adaptive_grid_search
+from utils import best_checkpoint_path
+
+
+class MicroBatcher:
+    """
+    Fasst gleichzeitig eintreffende Anfragen zu dynamischen Micro-Batches zusammen.
+
+    Ein Batch wird ausgewertet, sobald `max_batch_size` Regelparameter-Kombinationen gesammelt sind oder seit der
+    ersten wartenden Anfrage `max_latency_ms` vergangen sind. Die Auswertung (`predict_ruecklauftemp_batch`) läuft in
+    einem Thread, damit die Event-Loop weitere Anfragen annimmt.
+    """
+    def __init__(self, model, dataset, executor, max_batch_size=16, max_latency_ms=10.0, mixed_precision=False):
+        self.model = model
+        self.dataset = dataset
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.mixed_precision = mixed_precision
+        self.queue = asyncio.Queue()
+        self.batch_sizes = deque(maxlen=10000)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, regelparams):
+        """Mittlere Rücklauftemperatur je Kombination; `regelparams` hat die Form (n, 2)."""
+        regelparams = np.asarray(regelparams, dtype=np.float32).reshape(-1, self.dataset.regelparams.shape[1])
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((regelparams, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            n_params = len(requests[0][0])
+            deadline = loop.time() + self.max_latency
+            while n_params < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                n_params += len(request[0])
+            batch = np.concatenate([regelparams for regelparams, _ in requests])
+            self.batch_sizes.append(len(batch))
+            try:
+                temps = await loop.run_in_executor(self.executor, lambda: predict_ruecklauftemp_batch(
+                    self.model, self.dataset, batch, params_per_pass=self.max_batch_size,
+                    mixed_precision=self.mixed_precision))
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offset = 0
+            for regelparams, future in requests:
+                if not future.done():
+                    future.set_result(temps[offset:offset + len(regelparams)].tolist())
+                offset += len(regelparams)
+
+
+class InferenceServer:
+    """
+    HTTP-Server (asyncio, nur Standardbibliothek) für Vorhersagen und Regelparameter-Empfehlungen.
+
+    Modelle und Datensätze aller Stationen werden beim Start einmal geladen und bleiben im Speicher.
+    Endpunkte:
+      POST /predict    {"station": ..., "regelparams": [[Steigung, Level], ...]} -> {"ruecklauftemp": [...]}
+      GET  /recommend?station=...  empfohlene Regelparameter (adaptive Grid Search, einmal je Station berechnet)
+      GET  /metrics    Latenzen (p50/p95/p99), Durchsatz und Batch-Größen
+      GET  /health
+    """
+    def __init__(self, stations, max_batch_size=16, max_latency_ms=10.0):
+        # Ein Thread für die Micro-Batches (torch nutzt darin selbst alle zugewiesenen Kerne) und ein eigener für die
+        # mehrsekündigen Empfehlungen, damit /recommend die Vorhersagen nicht blockiert
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.recommend_executor = ThreadPoolExecutor(max_workers=1)
+        self.stations = stations
+        self.max_batch_size = max_batch_size
+        self.max_latency_ms = max_latency_ms
+        self.batchers = {}
+        self.recommendations = {}
+        self.latencies = deque(maxlen=10000)
+        self.n_requests = 0
+        self.n_errors = 0
+        self.start_time = time.monotonic()
+        self.server = None
+
+    @classmethod
+    def from_fleet_dir(cls, fleet_dir, **kwargs):
+        """Lädt alle Stationen unter `fleet_dir` (Aufbau wie in `fleet_optimization.discover_stations`)."""
+        stations = {}
+        for station in discover_stations(fleet_dir):
+            config = station["config"]
+            dataset = HAST_Dataset(time_horizon=config["time_horizon"], split=optimization_split(config),
+                                   root=station["data_root"])
+            model = build_model(config, input_dim=dataset.input_dim())
+            model.load_state_dict(torch.load(best_checkpoint_path(station["model_dir"]), map_location="cpu"))
+            model.eval()
+            stations[station["station"]] = (model, dataset, config.get("mixed_precision", False))
+            logging.warning(f"Station {station['station']} geladen")
+        return cls(stations, **kwargs)
+
+    async def start(self, host="127.0.0.1", port=8080):
+        for name, (model, dataset, mixed_precision) in self.stations.items():
+            batcher = MicroBatcher(model, dataset, self.executor, max_batch_size=self.max_batch_size,
+                                   max_latency_ms=self.max_latency_ms, mixed_precision=mixed_precision)
+            batcher.start()
+            self.batchers[name] = batcher
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logging.warning(f"Inferenz-Server auf http://{host}:{port} mit {len(self.stations)} Stationen")
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for batcher in self.batchers.values():
+            batcher.task.cancel()
+        self.executor.shutdown(wait=False)
+        self.recommend_executor.shutdown(wait=False)
+
+    def _station(self, name):
+        if name is None and len(self.batchers) == 1:
+            return next(iter(self.batchers))
+        if name not in self.batchers:
+            raise KeyError(f"Unbekannte Station: {name}")
+        return name
+
+    async def _recommend(self, name):
+        if name not in self.recommendations:
+            model, dataset, mixed_precision = self.stations[name]
+            bounds = list(zip(dataset.regelparams.min(axis=0), dataset.regelparams.max(axis=0)))
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.recommend_executor, lambda: adaptive_grid_search(model, dataset, bounds, mixed_precision=mixed_precision))
+            self.recommendations[name] = {"station": name, "Steigung": float(result["best_params"][0]),
+                                          "Level": float(result["best_params"][1]),
+                                          "ruecklauftemp": float(result["best_value"])}
+        return self.recommendations[name]
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        batch_sizes = [size for batcher in self.batchers.values() for size in batcher.batch_sizes]
+        uptime = time.monotonic() - self.start_time
+        return {"requests": self.n_requests, "errors": self.n_errors, "uptime_s": uptime,
+                "requests_per_s": self.n_requests / uptime if uptime > 0 else 0.0,
+                "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95)),
+                               "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())},
+                "batches": len(batch_sizes), "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+                "queue_depth": {name: batcher.queue.qsize() for name, batcher in self.batchers.items()}}
+
+    async def _dispatch(self, method, path, query, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "stations": list(self.batchers)}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "GET" and path == "/recommend":
+            return 200, await self._recommend(self._station(query.get("station")))
+        if method == "POST" and path == "/predict":
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("Anfrage muss ein JSON-Objekt sein")
+            name = self._station(request.get("station"))
+            temps = await self.batchers[name].predict(request["regelparams"])
+            return 200, {"station": name, "ruecklauftemp": temps}
+        return 404, {"error": f"{method} {path} nicht gefunden"}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                path, _, query_string = target.partition("?")
+                path = unquote(path)
+                # URL-dekodiert, bei mehrfach angegebenen Parametern gilt der letzte Wert
+                query = {key: values[-1] for key, values in parse_qs(query_string).items()}
+
+                start = time.monotonic()
+                try:
+                    status, response = await self._dispatch(method, path, query, body)
+                except KeyError as e:
+                    status, response = 400, {"error": e.args[0] if e.args else str(e)}
+                except ValueError as e:
+                    # Ungültiges JSON (json.JSONDecodeError) oder Regelparameter in falscher Form
+                    status, response = 400, {"error": f"Ungültige Anfrage: {e}"}
+                except Exception as e:
+                    status, response = 500, {"error": str(e)}
+                if path in ("/predict", "/recommend"):
+                    self.n_requests += 1
+                    self.n_errors += status >= 400
+                    self.latencies.append(time.monotonic() - start)
+
+                payload = json.dumps(response).encode()
+                keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def http_request(host, port, method, path, payload=None):
+    """Minimaler HTTP-Client (eine Anfrage pro Verbindung), z. B. für Tests gegen den lokalen Server."""
+    reader, writer = await asyncio.open_connection(host, port)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    header, _, response_body = response.partition(b"\r\n\r\n")
+    return int(header.split(b" ", 2)[1]), json.loads(response_body)
+
+
+async def load_test(host="127.0.0.1", port=8080, n_requests=200, concurrency=32, station=None):
+    """Sendet `n_requests` Vorhersage-Anfragen mit `concurrency` gleichzeitigen Clients und gibt /metrics zurück."""
+    rng = np.random.default_rng(0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with semaphore:
+            regelparams = [[float(rng.uniform(0.5, 2.0)), float(rng.uniform(0.0, 7.0))]]
+            return await http_request(host, port, "POST", "/predict", {"station": station, "regelparams": regelparams})
+
+    await asyncio.gather(*[one_request() for _ in range(n_requests)])
+    return (await http_request(host, port, "GET", "/metrics"))[1]
+
+
+async def main(fleet_dir, host="127.0.0.1", port=8080, run_load_test=False):
+    server = InferenceServer.from_fleet_dir(fleet_dir)
+    await server.start(host, port)
+    if run_load_test:
+        print(json.dumps(await load_test(host, port), indent=2))
+        await server.stop()
+        return
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    # Stationen wie in fleet_optimization.py; mit run_load_test=True wird lokal ein Lasttest ausgeführt
+    asyncio.run(main(Path("../experiments"), run_load_test=True))
@@ -0,0 +1,77 @@
+import torch
+
+
+class MetricsAccumulator:
+    """
+    Summiert Verlust und Fehlerstatistiken einer Epoche als Tensoren auf dem Rechengerät.
+
+    Pro Batch findet keine Synchronisation (`.item()`) und keine Kopie nach NumPy statt; erst `compute()`
+    materialisiert die Werte einmal pro Epoche. Neben dem mittleren Verlust werden der MAE je Schritt des
+    Vorhersagehorizonts und - bei bekannter Sample-Reihenfolge - der MAE je Regelparameter-Setup erfasst.
+    Vorhersagen werden nur mit `collect_predictions=True` in einen vorab allokierten Puffer geschrieben.
+    """
+    def __init__(self, dataset, device, n_samples=None, collect_predictions=False, per_setup=True):
+        self.device = device
+        self.n_samples = n_samples if n_samples is not None else len(dataset)
+        self.collect_predictions = collect_predictions
+        self.time_horizon = getattr(dataset, "time_horizon", None)
+        # Zuordnung Zeile -> Setup: die Zeitreihe wird je Setup einmal wiederholt (siehe HAST_Dataset)
+        self.rows_per_setup = None
+        if per_setup and hasattr(dataset, "time_series_inputs"):
+            self.rows_per_setup = dataset.time_series_inputs.shape[0]
+            self.n_setups = dataset.regelparams.shape[0]
+        self.loss_sum = torch.zeros((), device=device)
+        self.n_batches = 0
+        self.offset = 0
+        self.abs_error_per_step = None
+        self.predictions = None
+        self.targets = None
+        if self.rows_per_setup is not None:
+            self.abs_error_per_setup = torch.zeros(self.n_setups, device=device)
+            self.count_per_setup = torch.zeros(self.n_setups, device=device)
+
+    def _allocate(self, outputs):
+        self.abs_error_per_step = torch.zeros(outputs.shape[1:], device=self.device)
+        if self.collect_predictions:
+            self.predictions = torch.empty((self.n_samples, *outputs.shape[1:]), device=self.device)
+            self.targets = torch.empty((self.n_samples, *outputs.shape[1:]), device=self.device)
+
+    def update(self, loss, outputs, targets, sample_indices=None):
+        """
+        Nimmt einen Batch auf. Ohne `sample_indices` wird eine sequentielle Reihenfolge (shuffle=False) angenommen.
+        """
+        outputs = outputs.detach().reshape(targets.shape)
+        if self.abs_error_per_step is None:
+            self._allocate(outputs)
+        batch_size = outputs.shape[0]
+        self.loss_sum += loss.detach()
+        self.n_batches += 1
+        abs_error = torch.abs(outputs - targets)
+        self.abs_error_per_step += abs_error.sum(dim=0)
+
+        if sample_indices is None:
+            sample_indices = torch.arange(self.offset, self.offset + batch_size, device=self.device)
+        if self.rows_per_setup is not None and self.time_horizon is not None:
+            rows = sample_indices.to(self.device).unsqueeze(1) * self.time_horizon + \
+                   torch.arange(self.time_horizon, device=self.device)
+            setups = torch.clamp(rows // self.rows_per_setup, max=self.n_setups - 1).reshape(-1)
+            self.abs_error_per_setup.index_add_(0, setups, abs_error.reshape(-1))
+            self.count_per_setup.index_add_(0, setups, torch.ones_like(setups, dtype=self.count_per_setup.dtype))
+        if self.collect_predictions:
+            self.predictions[self.offset:self.offset + batch_size] = outputs
+            self.targets[self.offset:self.offset + batch_size] = targets
+        self.offset += batch_size
+
+    def compute(self):
+        """Materialisiert die gesammelten Werte (einmalige Synchronisation)."""
+        n_seen = max(self.offset, 1)
+        metrics = {
+            "loss": (self.loss_sum / max(self.n_batches, 1)).item(),
+            "mae_per_step": (self.abs_error_per_step / n_seen).cpu().numpy() if self.abs_error_per_step is not None else None,
+        }
+        if self.rows_per_setup is not None:
+            metrics["mae_per_setup"] = (self.abs_error_per_setup / torch.clamp(self.count_per_setup, min=1)).cpu().numpy()
+        if self.collect_predictions and self.predictions is not None:
+            metrics["predictions"] = self.predictions[:self.offset].cpu().numpy()
+            metrics["targets"] = self.targets[:self.offset].cpu().numpy()
+        return metrics
@@ -7,12 +7,12 @@ class MLPModel(nn.Module):
     """
     Multi-Layer Perceptron (MLP) für Sequenzdaten.
     """
-    def __init__(self, input_dim=24, hidden_dims=[128, 64], output_dim=20,dropout_rate=0.5, flatten =True):
+    def __init__(self, input_dim=24, hidden_dims=[128, 64], output_dim=20,dropout_rate=0.5, flatten =True, sequence_length=20):
         super(MLPModel, self).__init__()
         self.flatten= flatten
         self.input_dim = input_dim
-        self.sequence_length = 20
-        self.flattened_input_dim = input_dim * 20
+        self.sequence_length = sequence_length
+        self.flattened_input_dim = input_dim * sequence_length
 
         self.fc1 = nn.Linear(self.flattened_input_dim, hidden_dims[0])
         self.bn1 = nn.BatchNorm1d(hidden_dims[0])
@@ -44,14 +44,17 @@ class CNNModel(nn.Module):
     1D Convolutional Neural Network (CNN) zur Verarbeitung von Zeitreihendaten.
     """
     def __init__(self, input_features=24, sequence_length=20, dropout_rate=0.6,n_layers = 2, batch_norm = True,
-                 kernel_size= 3, pad = 1, size_out = 20, pool=True):
+                 kernel_size= 3, pad = 1, size_out = 20, pool=True, channels=None):
         super(CNNModel, self).__init__()
 
         layers = []
         self.output_size = size_out
         in_channels = input_features
         for i in range(n_layers):
-            out_channels = 64 if i == 0 else 32
+            if channels is not None:
+                out_channels = channels[i]
+            else:
+                out_channels = 64 if i == 0 else 32
             layers.append(nn.Conv1d(in_channels, out_channels, kernel_size=kernel_size, padding=pad))
             sequence_length = sequence_length + 2*pad - kernel_size + 1
 
@@ -100,6 +103,23 @@ class LSTMModel(nn.Module):
         output = self.fc(final_hidden)
         return output
 
+
+def build_model(config, input_dim=24):
+    """Erzeugt das in `config["model"]` gewählte Modell ("CNN" (Standard), "MLP" oder "LSTM") aus einer Trainingskonfiguration."""
+    model_type = config.get("model", "CNN")
+    time_horizon = config["time_horizon"]
+    if model_type == "CNN":
+        return CNNModel(input_features=input_dim, sequence_length=time_horizon, n_layers=config["n_layers"],
+                        batch_norm=config["batch_norm"], dropout_rate=config["dropout"], kernel_size=config["kernel_size"],
+                        pool=config["pool"], size_out=time_horizon, channels=config.get("channels"))
+    if model_type == "MLP":
+        return MLPModel(input_dim=input_dim, hidden_dims=config.get("hidden_dims", [128, 64]), output_dim=time_horizon,
+                        dropout_rate=config["dropout"], sequence_length=time_horizon)
+    if model_type == "LSTM":
+        return LSTMModel(input_size=input_dim, hidden_size=config.get("hidden_size", 64),
+                         num_layers=config.get("num_layers", 2), output_size=time_horizon, dropout=config["dropout"])
+    raise ValueError(f"Unbekannter Modelltyp: {model_type}")
+
 if __name__ == '__main__':
     from torch.utils.data import DataLoader
     dataset = HAST_Dataset()
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from dataset import dataset_content_hash
+
+
+def model_content_hash(model):
+    """SHA-256 über Namen und Werte aller Parameter und Buffer des Modells (unabhängig vom Gerät)."""
+    digest = hashlib.sha256(type(model).__name__.encode())
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ObjectiveCache:
+    """
+    Memoisiert Surrogat-Auswertungen (mittlere Rücklauftemperatur je Regelparameter-Kombination).
+
+    Schlüssel sind Modell-Hash, Inhalts-Hash des Datensatzes, bf16-Schalter und der auf `decimals` Stellen gerundete
+    Parametervektor; Punkte, die sich erst hinter der Rundung unterscheiden, teilen sich also einen Wert. Die erste
+    Stufe ist ein LRU-Cache im Speicher (`max_memory_entries`), die zweite eine SQLite-Datei (`path`, optional), die
+    über Läufe und Prozesse hinweg bestehen bleibt. Treffer und Fehlzugriffe werden je Stufe gezählt.
+    """
+    def __init__(self, path=None, max_memory_entries=100_000, decimals=4):
+        self.path = None if path is None else Path(path)
+        self.max_memory_entries = max_memory_entries
+        self.decimals = decimals
+        self.memory = OrderedDict()
+        self.connection = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        # (id(model), id(dataset), bf16) -> (Fingerabdruck der Modell-Tensoren, Schlüssel-Präfix)
+        self._prefixes = {}
+
+    def __getstate__(self):
+        # Für Worker-Prozesse: nur die Einstellungen übertragen, Verbindung und Speicher werden neu aufgebaut
+        return {"path": self.path, "max_memory_entries": self.max_memory_entries, "decimals": self.decimals}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self.connection is None and self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS objective_cache (key TEXT PRIMARY KEY, value REAL)")
+        return self.connection
+
+    def prefix(self, model, dataset, mixed_precision=False):
+        """
+        Schlüssel-Präfix aus Modell-Hash, Datensatz-Hash und bf16-Schalter.
+
+        Die Hashes werden je Modell und Datensatz nur einmal berechnet. Ob sich die Gewichte seitdem geändert haben,
+        wird über Identität, Speicheradresse und Versionszähler (`_version`, wird bei jeder In-place-Änderung erhöht)
+        der Tensoren geprüft, ohne die Werte erneut zu serialisieren.
+        """
+        fingerprint = tuple((id(tensor), tensor.data_ptr(), tensor._version)
+                            for tensor in model.state_dict(keep_vars=True).values())
+        memo_key = (id(model), id(dataset), bool(mixed_precision))
+        cached = self._prefixes.get(memo_key)
+        if cached is None or cached[0] != fingerprint:
+            prefix = f"{model_content_hash(model)}:{dataset_content_hash(dataset)}:{int(mixed_precision)}"
+            cached = self._prefixes[memo_key] = (fingerprint, prefix)
+        return cached[1]
+
+    def keys(self, model, dataset, regelparams_batch, mixed_precision=False):
+        prefix = self.prefix(model, dataset, mixed_precision)
+        rounded = np.round(np.asarray(regelparams_batch, dtype=np.float64), self.decimals) + 0.0
+        return [f"{prefix}:{','.join(repr(float(v)) for v in params)}" for params in rounded]
+
+    def get_many(self, keys):
+        """Gespeicherte Werte zu `keys`; NaN für Fehlzugriffe."""
+        values = np.full(len(keys), np.nan)
+        disk_lookup = []
+        for i, key in enumerate(keys):
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                values[i] = self.memory[key]
+                self.hits_memory += 1
+            else:
+                disk_lookup.append(i)
+        connection = self._connect()
+        if connection is not None and disk_lookup:
+            found = {}
+            lookup_keys = [keys[i] for i in disk_lookup]
+            # SQLite begrenzt die Anzahl der Platzhalter pro Abfrage
+            for start in range(0, len(lookup_keys), 500):
+                chunk = lookup_keys[start:start + 500]
+                rows = connection.execute(f"SELECT key, value FROM objective_cache WHERE key IN "
+                                          f"({', '.join('?' for _ in chunk)})", chunk).fetchall()
+                found.update(rows)
+            for i in disk_lookup:
+                if keys[i] in found:
+                    values[i] = found[keys[i]]
+                    self._remember(keys[i], values[i])
+                    self.hits_disk += 1
+        self.misses += int(np.isnan(values).sum())
+        return values
+
+    def put_many(self, keys, values):
+        for key, value in zip(keys, values):
+            self._remember(key, float(value))
+        connection = self._connect()
+        if connection is not None:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO objective_cache (key, value) VALUES (?, ?)",
+                                       [(key, float(value)) for key, value in zip(keys, values)])
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {"hits_memory": self.hits_memory, "hits_disk": self.hits_disk, "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0}
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.warning(f"Objective-Cache: {stats['hits_memory']} Speicher-Treffer, {stats['hits_disk']} Disk-Treffer, "
+                        f"{stats['misses']} Fehlzugriffe (Trefferquote {stats['hit_rate']:.1%})")
+        return stats
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -1,98 +1,406 @@
+import logging
+import os
 import torch
+import torch.nn as nn
 
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from itertools import product
 from torch.utils.data import DataLoader
 from dataset import HAST_Dataset
 from models import CNNModel
 from scipy.optimize import minimize
+from utils import load_manifest, best_checkpoint_path, bf16_autocast
+from profiling import profiled
+from bayesian_optimization import bayesian_optimize, latin_hypercube
 from pathlib import Path
 import json
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Modell und Datensatz der Multistart-Optimierung, werden einmal pro Worker-Prozess übergeben
+_model = None
+_dataset = None
+_mixed_precision = False
+# Aktiver Cache für Surrogat-Auswertungen (siehe objective_cache.py); None bedeutet ohne Cache
+_objective_cache = None
 
-def predict_ruecklauftemp(model, dataset, regelparams):
+
+def set_objective_cache(cache):
+    global _objective_cache
+    _objective_cache = cache
+
+
+@profiled("optimizer_forward")
+def predict_ruecklauftemp(model, dataset, regelparams, mixed_precision=False):
     """
     Simuliert die Rücklauftemperatur mit dem trainierten Modell für gegebene Regelparameter.
     """
-    all_preds = []
-    all_targets = []
-    # Aktualisiert die Regelparameter im Dataset-Objekt
-    updated_dataset = dataset
-    updated_dataset.regelparams[:, :2] = regelparams
-    updated_dataloader = DataLoader(updated_dataset, batch_size=len(dataset), shuffle=False, drop_last=False)
+    cache_keys = None
+    if _objective_cache is not None:
+        cache_keys = _objective_cache.keys(model, dataset, np.reshape(regelparams, (1, -1)), mixed_precision)
+        cached = _objective_cache.get_many(cache_keys)[0]
+        if not np.isnan(cached):
+            return cached
+    # Setzt die Regelparameter in die Inputs des gesamten Datensatzes ein
+    inputs = torch.from_numpy(dataset.inputs_for_regelparams(regelparams))
     model = model.to(device)
-    # Iteriert durch die Daten und macht Vorhersagen
-    with torch.no_grad():
-        for inputs, targets in updated_dataloader:
-            inputs = inputs.to(torch.float32).to(device)
-            outputs = model(inputs)
-            all_preds.append(outputs.cpu().numpy())
-            all_targets.append(targets.cpu().numpy())
+    # Macht Vorhersagen über den gesamten Datensatz
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision):
+        outputs = model(inputs.to(device))
+    all_preds = outputs.float().cpu().numpy()
 
     # Berechnet den Mittelwert der vorhergesagten Rücklauftemperatur
-    all_preds = np.concatenate(all_preds, axis=0)
     mean_temp = np.mean(all_preds)  # You can modify this depending on how Rücklauftemperatur is defined
+    if cache_keys is not None:
+        _objective_cache.put_many(cache_keys, [mean_temp])
     return mean_temp
 
 
-def objective(regelparams_flat, model, dataset):
+@profiled("optimizer_forward_batch")
+def predict_outputs_for_regelparams(model, dataset, regelparams_batch, params_per_pass=8, mixed_precision=False):
+    """
+    Vorhersagen des Modells über den gesamten Datensatz für mehrere Regelparameter-Kombinationen.
+
+    Jeweils `params_per_pass` Kombinationen werden in einem gemeinsamen Forward-Pass ausgewertet.
+    :return: Array der Form (n_params, len(dataset), output_dim).
+    """
+    regelparams_batch = np.asarray(regelparams_batch, dtype=np.float32).reshape(-1, dataset.regelparams.shape[1])
+    model = model.to(device)
+    all_preds = []
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision):
+        for start in range(0, regelparams_batch.shape[0], params_per_pass):
+            inputs = torch.from_numpy(dataset.inputs_for_regelparams(regelparams_batch[start:start + params_per_pass]))
+            outputs = model(inputs.to(device))
+            all_preds.append(outputs.float().cpu().numpy())
+    all_preds = np.concatenate(all_preds, axis=0)
+    return all_preds.reshape(regelparams_batch.shape[0], len(dataset), -1)
+
+
+def predict_ruecklauftemp_batch(model, dataset, regelparams_batch, params_per_pass=8, mixed_precision=False):
+    """
+    Mittlere vorhergesagte Rücklauftemperatur je Regelparameter-Kombination (vektorisierte Variante von
+    predict_ruecklauftemp). Mit aktivem Objective-Cache werden nur noch nicht bekannte Kombinationen ausgewertet.
+    """
+    if _objective_cache is None:
+        all_preds = predict_outputs_for_regelparams(model, dataset, regelparams_batch, params_per_pass=params_per_pass,
+                                                    mixed_precision=mixed_precision)
+        return all_preds.reshape(all_preds.shape[0], -1).mean(axis=1)
+    regelparams_batch = np.asarray(regelparams_batch).reshape(-1, dataset.regelparams.shape[1])
+    cache_keys = _objective_cache.keys(model, dataset, regelparams_batch, mixed_precision)
+    temps = _objective_cache.get_many(cache_keys)
+    missing = np.where(np.isnan(temps))[0]
+    if len(missing) > 0:
+        all_preds = predict_outputs_for_regelparams(model, dataset, regelparams_batch[missing],
+                                                    params_per_pass=params_per_pass, mixed_precision=mixed_precision)
+        temps[missing] = all_preds.reshape(len(missing), -1).mean(axis=1)
+        _objective_cache.put_many([cache_keys[i] for i in missing], temps[missing])
+    return temps
+
+
+@contextmanager
+def mc_dropout(model):
+    """
+    Aktiviert für die Dauer des Blocks alle `nn.Dropout`-Module (Monte-Carlo-Dropout), während BatchNorm und alle
+    übrigen Module im Eval-Modus bleiben. Danach wird der vorherige Modus wiederhergestellt. Die Dropout-Schicht
+    zwischen den Lagen von `nn.LSTM` bleibt dabei inaktiv.
+    """
+    was_training = model.training
+    model.eval()
+    dropouts = [module for module in model.modules() if isinstance(module, nn.Dropout)]
+    for module in dropouts:
+        module.train()
+    try:
+        yield len(dropouts)
+    finally:
+        model.train(was_training)
+
+
+@profiled("optimizer_forward_mc")
+def predict_ruecklauftemp_mc(model, dataset, regelparams_batch, n_samples=16, params_per_pass=1, seed=0,
+                             mixed_precision=False):
+    """
+    Mittelwert und Standardabweichung der mittleren Rücklauftemperatur je Regelparameter-Kombination unter
+    MC-Dropout.
+
+    Die Inputs von `params_per_pass` Kombinationen werden `n_samples`-fach repliziert und in einem gemeinsamen
+    Forward-Pass ausgewertet, jede Replik mit eigener Dropout-Maske. Mit `seed` ziehen alle Kombinationen dieselben
+    Zufallszahlen (common random numbers), sodass Unterschiede zwischen Kandidaten nicht vom Rauschen überdeckt
+    werden; der globale Zufallszustand von torch bleibt unverändert.
+    :return: Zwei Arrays der Form (n_params,): Mittelwert und Standardabweichung über die Repliken.
+    """
+    regelparams_batch = np.asarray(regelparams_batch, dtype=np.float32).reshape(-1, dataset.regelparams.shape[1])
+    model = model.to(device)
+    means, stds = [], []
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision), mc_dropout(model) as n_dropout, \
+            torch.random.fork_rng(devices=[device] if device.type == "cuda" else []):
+        if n_dropout == 0:
+            logging.warning("Modell ohne Dropout-Module: MC-Dropout liefert Standardabweichung 0")
+        for start in range(0, regelparams_batch.shape[0], params_per_pass):
+            chunk = regelparams_batch[start:start + params_per_pass]
+            inputs = torch.from_numpy(dataset.inputs_for_regelparams(chunk)).to(device)
+            if seed is not None:
+                torch.manual_seed(seed)
+            outputs = model(inputs.repeat(n_samples, 1, 1)).float().cpu().numpy()
+            # (n_samples, n_params, Vorhersagen über den Datensatz) -> mittlere Rücklauftemperatur je Replik
+            sample_means = outputs.reshape(n_samples, chunk.shape[0], -1).mean(axis=2)
+            means.append(sample_means.mean(axis=0))
+            stds.append(sample_means.std(axis=0, ddof=1) if n_samples > 1 else np.zeros(chunk.shape[0]))
+    return np.concatenate(means), np.concatenate(stds)
+
+
+def risk_averse_objective(model, dataset, risk_aversion=None, mc_samples=16, params_per_pass=8, mixed_precision=False):
+    """
+    Gebatchte Zielfunktion für die Optimierer: ohne `risk_aversion` die Punktvorhersage im Eval-Modus
+    (`predict_ruecklauftemp_batch`), sonst Mittelwert + risk_aversion * Standardabweichung unter MC-Dropout.
+    Risikoaverse Ziele meiden Regelparameter, bei denen das Surrogat unsicher ist (z. B. weil es extrapoliert).
+    """
+    if risk_aversion is None:
+        return lambda regelparams_batch: predict_ruecklauftemp_batch(model, dataset, regelparams_batch,
+                                                                     params_per_pass=params_per_pass,
+                                                                     mixed_precision=mixed_precision)
+
+    def evaluate(regelparams_batch):
+        mean, std = predict_ruecklauftemp_mc(model, dataset, regelparams_batch, n_samples=mc_samples,
+                                             params_per_pass=max(1, params_per_pass // mc_samples),
+                                             mixed_precision=mixed_precision)
+        return mean + risk_aversion * std
+
+    return evaluate
+
+
+def objective(regelparams_flat, model, dataset, mixed_precision=False):
     """Zielfunktion für die gradientenbasierte Optimierung (scipy.minimize)."""
     regelparams = regelparams_flat.reshape(1, -1)
-    return predict_ruecklauftemp(model, dataset, regelparams)
+    return predict_ruecklauftemp(model, dataset, regelparams, mixed_precision=mixed_precision)
 
-def optimize_regelparams(model, dataset, initial_guess, bounds):
+def optimize_regelparams(model, dataset, initial_guess, bounds, mixed_precision=False, eps=1e-3, return_result=False):
     """
     Führt die gradientenbasierte Optimierung der Regelparameter durch.
 
     Nutzt 'L-BFGS-B' zur Minimierung der Zieltemperatur innerhalb der gegebenen Grenzen (Bounds).
+    Die Gradienten werden per finiter Differenzen mit Schrittweite `eps` bestimmt; sie muss deutlich über der
+    float32-Auflösung des Modells liegen, sonst verschwindet der Gradient und die Optimierung endet im Startpunkt.
     """
-    result = minimize(objective, initial_guess, args=(model, dataset),
-                      method='L-BFGS-B', bounds=bounds)
-
+    result = minimize(objective, initial_guess, args=(model, dataset, mixed_precision),
+                      method='L-BFGS-B', bounds=bounds, options={"eps": eps})
+    if return_result:
+        return result
     return result.x.tolist()
 
 
-def optimize_regelparams_for_trained_model(model, dataset,root, split="test"):
+def _init_worker(model, dataset, n_threads, mixed_precision, objective_cache=None):
+    global _model, _dataset, _mixed_precision, _objective_cache
+    _model, _dataset, _mixed_precision, _objective_cache = model, dataset, mixed_precision, objective_cache
+    _model.eval()
+    torch.set_num_threads(n_threads)
+
+
+def _run_local_optimization(initial_guess, bounds):
+    result = optimize_regelparams(_model, _dataset, initial_guess, bounds, mixed_precision=_mixed_precision,
+                                  return_result=True)
+    return {"start": np.asarray(initial_guess).tolist(), "params": result.x.tolist(), "value": float(result.fun),
+            "n_evaluations": int(result.nfev), "success": bool(result.success)}
+
+
+def multi_start_starts(model, dataset, bounds, n_starts=8, seeding="lhs", seed=0, mixed_precision=False):
     """
-    Führt Grid Search und anschließende gradientenbasierte Optimierung durch,
-    um die optimalen Regelparameter zu finden.
+    Startpunkte der Multistart-Optimierung: Latin Hypercube über die Bounds (`"lhs"`) oder die Mittelpunkte der
+    `n_starts` besten Zellen eines groben Gitters, das in einem Batch ausgewertet wird (`"grid"`).
     """
-    min_m, max_m = np.min(dataset.regelparams, axis=0)[0], np.max(dataset.regelparams, axis=0)[0]
-    min_l, max_l = np.min(dataset.regelparams, axis=0)[1], np.max(dataset.regelparams, axis=0)[1]
-    model.eval()
-    regelparam_grid = list(product(
-        np.round(np.arange(min_m, max_m + 0.1, 0.1), 2),
-        np.round(np.arange(min_l, max_l + 0.5, 0.5), 2)
-    ))
+    bounds = np.asarray(bounds, dtype=np.float64)
+    low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+    if seeding == "lhs":
+        return low + latin_hypercube(n_starts, len(bounds), np.random.default_rng(seed)) * span
+    if seeding == "grid":
+        cells_per_dim = max(2, int(np.ceil(np.sqrt(4 * n_starts))))
+        centers = (np.arange(cells_per_dim) + 0.5) / cells_per_dim
+        grid = low + np.array(list(product(*[centers] * len(bounds)))) * span
+        temps = predict_ruecklauftemp_batch(model, dataset, grid, params_per_pass=16, mixed_precision=mixed_precision)
+        return grid[np.argsort(temps)[:n_starts]]
+    raise ValueError(f"Unbekannte Startpunkt-Wahl: {seeding}")
+
+
+def multi_start_optimize_regelparams(model, dataset, bounds, n_starts=8, seeding="lhs", n_workers=None, seed=0,
+                                     mixed_precision=False, tolerance=1e-2):
+    """
+    L-BFGS-B von mehreren Startpunkten, parallel in einem Prozess-Pool. Modell und Datensatz werden einmal an jeden
+    Worker übergeben.
 
-    # Perform the grid search over the regelparam combinations
-    best_params = None
-    best_temp = float('inf')
+    Neben dem besten Ergebnis wird die Streuung der lokalen Optima berichtet: Werte, Standardabweichung der
+    Parameter und Anzahl unterschiedlicher Optima (Abstand > `tolerance` relativ zur Spannweite der Bounds).
+    """
+    starts = multi_start_starts(model, dataset, bounds, n_starts=n_starts, seeding=seeding, seed=seed,
+                                mixed_precision=mixed_precision)
+    n_workers = n_workers or min(len(starts), os.cpu_count() or 1)
+    n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    model = model.cpu()
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                             initargs=(model, dataset, n_threads, mixed_precision, _objective_cache)) as pool:
+        local_results = list(pool.map(_run_local_optimization, starts, [bounds] * len(starts)))
+
+    local_results.sort(key=lambda r: r["value"])
+    optima = np.array([r["params"] for r in local_results])
+    values = np.array([r["value"] for r in local_results])
+    span = np.asarray(bounds, dtype=np.float64)[:, 1] - np.asarray(bounds, dtype=np.float64)[:, 0]
+    distinct = []
+    for optimum in optima / np.where(span > 0, span, 1.0):
+        if all(np.max(np.abs(optimum - other)) > tolerance for other in distinct):
+            distinct.append(optimum)
+    return {
+        "best_params": local_results[0]["params"],
+        "best_value": local_results[0]["value"],
+        "n_starts": len(starts),
+        "n_distinct_optima": len(distinct),
+        "value_range": [float(values.min()), float(values.max())],
+        "value_std": float(values.std()),
+        "param_std": optima.std(axis=0).tolist(),
+        "n_evaluations": int(sum(r["n_evaluations"] for r in local_results)),
+        "local_optima": local_results,
+    }
+
+
+def bayesian_optimize_regelparams(model, dataset, bounds, n_initial=8, batch_size=4, n_iterations=8, seed=0,
+                                  mixed_precision=False, risk_aversion=None, mc_samples=16):
+    """
+    Bayes'sche Optimierung der Regelparameter: jeder vorgeschlagene Batch wird in einem gemeinsamen Forward-Pass
+    (`predict_ruecklauftemp_batch`) ausgewertet, mit `risk_aversion` risikoavers (siehe `risk_averse_objective`).
+    """
+    objective_batch = risk_averse_objective(model, dataset, risk_aversion=risk_aversion, mc_samples=mc_samples,
+                                            params_per_pass=max(batch_size, n_initial), mixed_precision=mixed_precision)
+    return bayesian_optimize(objective_batch, bounds, n_initial=n_initial, batch_size=batch_size, n_iterations=n_iterations,
+                             seed=seed)
 
-    for params in regelparam_grid:
 
-        temp = predict_ruecklauftemp(model, dataset, params)
-        if temp < best_temp:
-            print("Update von min. Rücklauftemperatur von ", best_temp,"auf ", temp)
-            print("Update von besten Regelparametern von ", best_params,"auf ", params)
-            best_temp = temp
-            best_params = params
+def adaptive_grid_search(model, dataset, bounds, points_per_dim=5, n_best=3, refinement=3, budget=150,
+                         min_resolution=None, params_per_pass=8, mixed_precision=False, risk_aversion=None,
+                         mc_samples=16):
+    """
+    Adaptive Grid Search von grob nach fein.
+
+    Zuerst wird ein grobes Gitter mit `points_per_dim` Punkten je Parameter in einem Batch ausgewertet. Danach wird
+    wiederholt nur um die `n_best` besten bisherigen Punkte verfeinert: Im Umkreis einer Zelle wird ein Gitter mit
+    `refinement`-fach kleinerer Schrittweite gelegt und alle noch unbekannten Punkte in einem Batch ausgewertet.
+    Die Suche endet, wenn das Budget an Auswertungen (`budget`) erschöpft ist, die Schrittweite `min_resolution`
+    (je Parameter) erreicht oder keine neuen Punkte mehr entstehen. Mit `risk_aversion` wird
+    Mittelwert + risk_aversion * Standardabweichung unter MC-Dropout minimiert (siehe `risk_averse_objective`).
+    :return: Dict mit best_params, best_value, erreichter Auflösung (Schrittweite je Parameter), Anzahl
+             ausgewerteter Punkte und Forward-Pässe sowie den Stufen der Verfeinerung.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    low, high = bounds[:, 0], bounds[:, 1]
+    step = np.where(high > low, (high - low) / (points_per_dim - 1), 0.0)
+    min_resolution = np.zeros(len(bounds)) if min_resolution is None else np.asarray(min_resolution, dtype=np.float64)
+    evaluated = {}
+    n_forward_passes = 0
+    levels = []
+    objective_batch = risk_averse_objective(model, dataset, risk_aversion=risk_aversion, mc_samples=mc_samples,
+                                            params_per_pass=params_per_pass, mixed_precision=mixed_precision)
+    # Unter MC-Dropout enthält ein Forward-Pass weniger Kombinationen (je mc_samples Repliken)
+    params_per_forward = params_per_pass if risk_aversion is None else max(1, params_per_pass // mc_samples)
+
+    def evaluate(candidates):
+        nonlocal n_forward_passes
+        keys = [tuple(np.round(c, 10)) for c in candidates]
+        new = [c for key, c in dict(zip(keys, candidates)).items() if key not in evaluated]
+        new = np.array(new[:budget - len(evaluated)])
+        if len(new) == 0:
+            return 0
+        temps = objective_batch(new)
+        n_forward_passes += int(np.ceil(len(new) / params_per_forward))
+        for params, temp in zip(new, temps):
+            evaluated[tuple(np.round(params, 10))] = float(temp)
+        return len(new)
+
+    coarse = np.array(list(product(*[np.linspace(l, h, points_per_dim) if h > l else [l] for l, h in zip(low, high)])))
+    levels.append({"step": step.tolist(), "n_new": evaluate(coarse)})
+
+    while len(evaluated) < budget and np.any(step > min_resolution):
+        best = sorted(evaluated.items(), key=lambda item: item[1])[:n_best]
+        new_step = np.maximum(step / refinement, min_resolution)
+        offsets = [np.arange(-refinement, refinement + 1) * s if s > 0 else [0.0] for s in new_step]
+        candidates = np.array([np.clip(np.array(center) + np.array(offset), low, high)
+                               for center, _ in best for offset in product(*offsets)])
+        n_new = evaluate(candidates)
+        if n_new == 0:
+            break
+        step = new_step
+        levels.append({"step": step.tolist(), "n_new": n_new})
+
+    best_params, best_value = min(evaluated.items(), key=lambda item: item[1])
+    return {"best_params": list(best_params), "best_value": best_value, "resolution": step.tolist(),
+            "n_evaluations": len(evaluated), "n_forward_passes": n_forward_passes, "levels": levels}
+
+
+def optimize_regelparams_for_trained_model(model, dataset,root, split="test", mixed_precision=False, method="grid",
+                                           n_starts=8, risk_aversion=None, mc_samples=16):
+    """
+    Führt Grid Search (`method="grid"`), adaptive Grid Search (`method="adaptive"`) bzw. Bayes'sche Optimierung
+    (`method="bayes"`) und anschließende
+    gradientenbasierte Optimierung (L-BFGS-B von `n_starts` Startpunkten in den besten Gitterzellen) durch,
+    um die optimalen Regelparameter zu finden. Gibt die gespeicherten Ergebnisse auch zurück.
+    Mit `risk_aversion` minimiert die globale Suche Mittelwert + risk_aversion * Standardabweichung unter
+    MC-Dropout; die gradientenbasierte Stufe nutzt weiter die Punktvorhersage. Für beide Ergebnisse werden
+    Mittelwert und Standardabweichung unter MC-Dropout mitgespeichert.
+    """
+    min_m, max_m = np.min(dataset.regelparams, axis=0)[0], np.max(dataset.regelparams, axis=0)[0]
+    min_l, max_l = np.min(dataset.regelparams, axis=0)[1], np.max(dataset.regelparams, axis=0)[1]
+    model.eval()
+    if method == "bayes":
+        result = bayesian_optimize_regelparams(model, dataset, [(min_m, max_m), (min_l, max_l)],
+                                               mixed_precision=mixed_precision, risk_aversion=risk_aversion,
+                                               mc_samples=mc_samples)
+        best_params, best_temp = result["best_params"], result["best_value"]
+        print("Optimale Regelparameter (Bayes'sche Optimierung):", best_params, "nach", result["n_evaluations"],
+              "Auswertungen")
+    elif method == "adaptive":
+        result = adaptive_grid_search(model, dataset, [(min_m, max_m), (min_l, max_l)], mixed_precision=mixed_precision,
+                                      risk_aversion=risk_aversion, mc_samples=mc_samples)
+        best_params, best_temp = result["best_params"], result["best_value"]
+        print("Optimale Regelparameter (adaptive Grid Search):", best_params, "bei Auflösung", result["resolution"],
+              "nach", result["n_evaluations"], "Auswertungen in", result["n_forward_passes"], "Forward-Pässen")
+    elif method == "grid":
+        regelparam_grid = list(product(
+            np.round(np.arange(min_m, max_m + 0.1, 0.1), 2),
+            np.round(np.arange(min_l, max_l + 0.5, 0.5), 2)
+        ))
+
+        # Gitter in gebatchten Forward-Pässen auswerten, risikoavers unter MC-Dropout oder als Punktvorhersage
+        values = risk_averse_objective(model, dataset, risk_aversion=risk_aversion, mc_samples=mc_samples,
+                                       mixed_precision=mixed_precision)(np.array(regelparam_grid))
+        best_index = int(np.argmin(values))
+        best_params, best_temp = regelparam_grid[best_index], float(values[best_index])
+        if risk_aversion is not None:
+            print("Risikoaverse Auswahl (Mittelwert +", risk_aversion, "* Std.):", best_params)
+        print("Optimale Regelparameter (grid search):", best_params)
+    else:
+        raise ValueError(f"Unbekannte Optimierungsmethode: {method}")
 
-    print("Optimale Regelparameter (grid search):", best_params)
     print("Minimale Rücklauftemperatur:", best_temp)
     opt_param = {"best_m": best_params[0], "best_l": best_params[1]}
+    if method == "bayes":
+        opt_param["n_evaluations"] = result["n_evaluations"]
+    elif method == "adaptive":
+        opt_param.update({key: result[key] for key in ("n_evaluations", "n_forward_passes", "resolution")})
 
     print("OptimalerParameter: ")
     print(opt_param)
 
     print("Gradient-based optimization")
 
-    initial_guess = np.array([0.5, 0.5])
-    bounds = [(min_m, min_m), (min_l, max_l)]
+    bounds = [(min_m, max_m), (min_l, max_l)]
 
-    optimal_regelparams = optimize_regelparams(model, dataset, initial_guess, bounds)
-    opt_param["result gradient based"]= optimal_regelparams
+    multi_start = multi_start_optimize_regelparams(model, dataset, bounds, n_starts=n_starts, seeding="grid",
+                                                   mixed_precision=mixed_precision)
+    opt_param["result gradient based"]= multi_start["best_params"]
+    opt_param["gradient based local optima"] = {key: multi_start[key] for key in
+                                                ("best_value", "n_starts", "n_distinct_optima", "value_range",
+                                                 "value_std", "param_std")}
+    if risk_aversion is not None:
+        mc_mean, mc_std = predict_ruecklauftemp_mc(model, dataset, [best_params, multi_start["best_params"]],
+                                                   n_samples=mc_samples, mixed_precision=mixed_precision)
+        opt_param["mc_dropout"] = {"risk_aversion": risk_aversion, "n_samples": mc_samples,
+                                   "mean": mc_mean.tolist(), "std": mc_std.tolist()}
 
     print(opt_param)
     if split =="train":
@@ -101,6 +409,7 @@ def optimize_regelparams_for_trained_model(model, dataset,root, split="test"):
     else:
         with open(root/"optimized_params.json", "w") as f:
             json.dump(opt_param, f)
+    return opt_param
 
 
 if __name__ == "__main__":
@@ -113,13 +422,10 @@ if __name__ == "__main__":
     with open(root/"config.json", "r") as f:
         config = json.load(f)
 
-    val_losses=np.load(directory/"val_losses.npy")
-
-    best_epoch_loss = np.min(val_losses)
-    best_epoch = np.argmin(val_losses)
-    print("Best epoch: ", best_epoch, "with loss ", best_epoch_loss)
+    best_checkpoint = load_manifest(directory)["best"][0]
+    print("Best epoch: ", best_checkpoint["epoch"], "with loss ", best_checkpoint["val_loss"])
 
-    model_path = directory/f"model_{best_epoch}.pt"
+    model_path = best_checkpoint_path(directory)
 
     model = CNNModel(sequence_length=config["time_horizon"],n_layers = config["n_layers"], batch_norm = config["batch_norm"],
                      dropout_rate= config["dropout"], kernel_size=config["kernel_size"], size_out=config["time_horizon"],
@@ -0,0 +1,96 @@
+import logging
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from optimze_regel_params import predict_ruecklauftemp_batch
+from schedule_optimization import regelparam_grid
+
+
+def heating_curve_supply(dataset, regelparams):
+    """
+    Vorlaufsolltemperatur der Heizkurve je Zeitschritt für mehrere Regelparameter-Kombinationen.
+
+    Lineare Näherung der Heizkurve: T_VL = T_Raumsoll + Level + Steigung * (T_Raumsoll - T_Außen).
+    :param regelparams: Array der Form (n_params, 2) mit Steigung und Level.
+    :return: Array der Form (n_params, n_zeitschritte).
+    """
+    regelparams = np.asarray(regelparams, dtype=np.float64).reshape(-1, 2)
+    steigung, level = regelparams[:, 0:1], regelparams[:, 1:2]
+    room = dataset.room_setpoint[np.newaxis]
+    return room + level + steigung * np.maximum(room - dataset.outdoor_temperature[np.newaxis], 0.0)
+
+
+def comfort_deficit(dataset, regelparams):
+    """
+    Komfort-Proxy: mittlere Unterversorgung in Kelvin, d. h. um wie viel die Heizkurve den im Datensatz beobachteten
+    Vorlaufsollwert (`mbr1000VorlaufsollwertHk1`) unterschreitet. 0 bedeutet keine Unterversorgung.
+    """
+    supply = heating_curve_supply(dataset, regelparams)
+    return np.maximum(dataset.supply_setpoint[np.newaxis] - supply, 0.0).mean(axis=1)
+
+
+def non_dominated_sort(objectives):
+    """
+    Nicht-dominierte Sortierung (alle Ziele werden minimiert).
+
+    Die Dominanzmatrix wird einmal vektorisiert berechnet; anschließend werden die Fronten nacheinander abgetragen.
+    :param objectives: Array der Form (n_points, n_objectives).
+    :return: Rang je Punkt (0 = Pareto-Front).
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    less_equal = np.all(objectives[:, np.newaxis] <= objectives[np.newaxis], axis=2)
+    less = np.any(objectives[:, np.newaxis] < objectives[np.newaxis], axis=2)
+    # dominates[i, j]: Punkt i dominiert Punkt j
+    dominates = less_equal & less
+    n_dominating = dominates.sum(axis=0)
+    ranks = np.full(len(objectives), -1)
+    rank = 0
+    while np.any(ranks < 0):
+        front = (n_dominating == 0) & (ranks < 0)
+        ranks[front] = rank
+        n_dominating = n_dominating - dominates[front].sum(axis=0)
+        rank += 1
+    return ranks
+
+
+def pareto_front(model, dataset, grid=None, params_per_pass=8, mixed_precision=False):
+    """
+    Bewertet alle Gitterpunkte nach mittlerer vorhergesagter Rücklauftemperatur (gebatchte Forward-Pässe) und
+    Komfortdefizit und sortiert sie nicht-dominiert.
+    :return: DataFrame aller Punkte mit Rang, aufsteigend nach Rang und Rücklauftemperatur.
+    """
+    grid = regelparam_grid(dataset) if grid is None else np.asarray(grid, dtype=np.float64)
+    model.eval()
+    temps = predict_ruecklauftemp_batch(model, dataset, grid, params_per_pass=params_per_pass,
+                                        mixed_precision=mixed_precision)
+    deficits = comfort_deficit(dataset, grid)
+    ranks = non_dominated_sort(np.stack([temps, deficits], axis=1))
+    points = pd.DataFrame({"Steigung": grid[:, 0], "Level": grid[:, 1], "ruecklauftemp": temps,
+                           "komfortdefizit": deficits, "rang": ranks})
+    points["pareto"] = points["rang"] == 0
+    return points.sort_values(["rang", "ruecklauftemp"]).reset_index(drop=True)
+
+
+def pareto_front_for_trained_model(model, dataset, root, mixed_precision=False):
+    """Berechnet die Pareto-Front und speichert alle Punkte (`pareto_front.csv`) sowie einen Plot (`pareto_front.png`)."""
+    points = pareto_front(model, dataset, mixed_precision=mixed_precision)
+    root = Path(root)
+    points.to_csv(root / "pareto_front.csv", index=False)
+
+    front = points[points["pareto"]].sort_values("komfortdefizit")
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.scatter(points["komfortdefizit"], points["ruecklauftemp"], s=8, c="lightgray", label="Gitterpunkte")
+    ax.plot(front["komfortdefizit"], front["ruecklauftemp"], "o-", c="tab:red", label="Pareto-Front")
+    for _, row in front.iterrows():
+        ax.annotate(f"({row['Steigung']:.1f}, {row['Level']:.1f})", (row["komfortdefizit"], row["ruecklauftemp"]),
+                    fontsize=7)
+    ax.set_xlabel("Komfortdefizit [K]")
+    ax.set_ylabel("Mittlere Rücklauftemperatur")
+    ax.legend()
+    fig.savefig(root / "pareto_front.png", dpi=150, bbox_inches="tight")
+    plt.close(fig)
+    logging.warning(f"Pareto-Front mit {len(front)} von {len(points)} Punkten unter {root / 'pareto_front.csv'}")
+    return points
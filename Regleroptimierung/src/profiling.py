@@ -0,0 +1,141 @@
+import functools
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import pandas as pd
+import torch
+
+# Aktiver Profiler des laufenden Trainings; None bedeutet, dass alle Hooks wirkungslos sind
+_active_profiler = None
+
+
+class RunProfiler:
+    """
+    Sammelt Laufzeiten je Stufe (Datenladen, Forward, Backward, Checkpoints, Optimierer-Forward-Pässe usw.),
+    Durchsatz und Peak-RSS eines Laufs und schreibt sie strukturiert nach `profile.json`.
+
+    Für die Epochen in `trace_epochs` wird zusätzlich ein `torch.profiler`-Trace (Chrome-Format) geschrieben.
+    """
+    def __init__(self, output_path, trace_epochs=()):
+        self.output_path = Path(output_path)
+        self.trace_epochs = set(trace_epochs)
+        self.stages = {}
+        self.epochs = []
+        self.start_time = time.perf_counter()
+
+    def record(self, name, duration, samples=0):
+        stage = self.stages.setdefault(name, {"calls": 0, "total_s": 0.0, "samples": 0})
+        stage["calls"] += 1
+        stage["total_s"] += duration
+        stage["samples"] += samples
+
+    @contextmanager
+    def stage(self, name, samples=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, samples)
+
+    @contextmanager
+    def epoch(self, epoch):
+        """Misst eine Epoche; für ausgewählte Epochen läuft dabei torch.profiler."""
+        before = {name: dict(stage) for name, stage in self.stages.items()}
+        trace = None
+        if epoch in self.trace_epochs:
+            trace = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+            trace.__enter__()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if trace is not None:
+                trace.__exit__(None, None, None)
+                trace.export_chrome_trace(str(self.output_path.parent / f"trace_epoch_{epoch}.json"))
+            stages = {name: stage["total_s"] - before.get(name, {}).get("total_s", 0.0)
+                      for name, stage in self.stages.items()}
+            self.epochs.append({"epoch": epoch, "duration_s": duration, "stages_s": stages,
+                                "peak_rss_mb": peak_rss_mb()})
+
+    def summary(self):
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage, mean_s=stage["total_s"] / stage["calls"])
+            if stage["samples"] > 0 and stage["total_s"] > 0:
+                stages[name]["samples_per_s"] = stage["samples"] / stage["total_s"]
+        return {"wall_time_s": time.perf_counter() - self.start_time, "peak_rss_mb": peak_rss_mb(),
+                "stages": stages, "epochs": self.epochs}
+
+    def write(self):
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.output_path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def peak_rss_mb():
+    """Maximaler Resident Set Size des Prozesses in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux meldet KB, macOS Bytes
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def set_active_profiler(profiler):
+    global _active_profiler
+    _active_profiler = profiler
+
+
+def active_profiler():
+    return _active_profiler
+
+
+def profile_stage(name, samples=0):
+    """Kontext für eine Stufe; ohne aktiven Profiler ein No-op."""
+    if _active_profiler is None:
+        return nullcontext()
+    return _active_profiler.stage(name, samples)
+
+
+def profile_epoch(epoch):
+    if _active_profiler is None:
+        return nullcontext()
+    return _active_profiler.epoch(epoch)
+
+
+def profiled(name):
+    """Decorator, der jeden Aufruf der Funktion als Stufe `name` erfasst."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_batches(loader, name="data_loading"):
+    """Iteriert über `loader` und erfasst die Wartezeit auf jeden Batch als Stufe `name`."""
+    batches = iter(loader)
+    while True:
+        with profile_stage(name):
+            batch = next(batches, None)
+        if batch is None:
+            return
+        yield batch
+
+
+def compare_profiles(profile_paths):
+    """Tabelle der Gesamtzeit je Stufe (Spalten) für mehrere Läufe (Zeilen), z. B. zum Vergleich von Konfigurationen."""
+    rows = {}
+    for path in profile_paths:
+        with open(path, "r") as f:
+            profile = json.load(f)
+        row = {name: stage["total_s"] for name, stage in profile["stages"].items()}
+        row["wall_time_s"] = profile["wall_time_s"]
+        row["peak_rss_mb"] = profile["peak_rss_mb"]
+        rows[str(path)] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
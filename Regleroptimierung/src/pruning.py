@@ -0,0 +1,201 @@
+import copy
+import json
+import logging
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+from dataset import import_data
+from models import MLPModel, CNNModel
+from training import train_model, test_model, device
+from utils import best_checkpoint_path, count_parameters, measure_latency
+
+
+def prunable_groups(model):
+    """
+    Bestimmt die strukturiert prunebaren Einheiten eines Modells.
+
+    Jede Gruppe besteht aus dem erzeugenden Layer (Conv1d/Linear), einer optionalen BatchNorm und dem
+    konsumierenden Layer, dessen Input-Dimension mitverkleinert werden muss.
+    """
+    if isinstance(model, MLPModel):
+        return [
+            {"producer": (model, "fc1"), "bn": (model, "bn1"), "consumer": (model, "fc2"), "flatten": 1},
+            {"producer": (model, "fc2"), "bn": (model, "bn2"), "consumer": (model, "fc3"), "flatten": 1},
+        ]
+    if isinstance(model, CNNModel):
+        layers = model.conv_layers
+        conv_indices = [i for i, layer in enumerate(layers) if isinstance(layer, nn.Conv1d)]
+        groups = []
+        for n, i in enumerate(conv_indices):
+            bn = (layers, str(i + 1)) if isinstance(layers[i + 1], nn.BatchNorm1d) else None
+            if n + 1 < len(conv_indices):
+                groups.append({"producer": (layers, str(i)), "bn": bn, "consumer": (layers, str(conv_indices[n + 1])), "flatten": 1})
+            else:
+                sequence_length = model.fc.in_features // layers[i].out_channels
+                groups.append({"producer": (layers, str(i)), "bn": bn, "consumer": (model, "fc"), "flatten": sequence_length})
+        return groups
+    raise ValueError(f"Pruning wird für {type(model).__name__} nicht unterstützt")
+
+
+def architecture(model):
+    """Gibt die Layer-Breiten zurück, mit denen das (geprunte) Modell neu erzeugt werden kann."""
+    widths = [getattr(*group["producer"]).weight.shape[0] for group in prunable_groups(model)]
+    if isinstance(model, MLPModel):
+        return {"model": "MLPModel", "hidden_dims": widths}
+    return {"model": "CNNModel", "channels": widths}
+
+
+def magnitude_importance(model):
+    """L1-Norm der Gewichte je Ausgangskanal bzw. Ausgangsneuron."""
+    importances = []
+    for group in prunable_groups(model):
+        weight = getattr(*group["producer"]).weight.detach()
+        importances.append(weight.abs().sum(dim=tuple(range(1, weight.dim()))).cpu())
+    return importances
+
+
+def sensitivity_importance(model, loader, criterion):
+    """Taylor-Sensitivität |w * dL/dw| je Einheit, akkumuliert über den Validierungsdatensatz."""
+    groups = prunable_groups(model)
+    importances = [torch.zeros(getattr(*group["producer"]).weight.shape[0]) for group in groups]
+    model.eval()
+    for inputs, targets in loader:
+        inputs = inputs.to(torch.float32).to(device)
+        targets = targets.to(torch.float32).to(device)
+        model.zero_grad()
+        loss = criterion(torch.squeeze(model(inputs)), targets)
+        loss.backward()
+        for n, group in enumerate(groups):
+            layer = getattr(*group["producer"])
+            contribution = (layer.weight * layer.weight.grad).detach()
+            importances[n] += contribution.sum(dim=tuple(range(1, contribution.dim()))).abs().cpu()
+    model.zero_grad()
+    return importances
+
+
+def _slice_layer(layer, keep, dim):
+    """Erzeugt eine verkleinerte Kopie eines Conv1d/Linear-Layers entlang der Ausgangs- (0) oder Eingangsdimension (1)."""
+    weight = layer.weight.detach().index_select(dim, keep)
+    if isinstance(layer, nn.Conv1d):
+        new_layer = nn.Conv1d(weight.shape[1], weight.shape[0], kernel_size=layer.kernel_size, stride=layer.stride,
+                              padding=layer.padding, bias=layer.bias is not None)
+    else:
+        new_layer = nn.Linear(weight.shape[1], weight.shape[0], bias=layer.bias is not None)
+    new_layer.weight.data.copy_(weight)
+    if layer.bias is not None:
+        bias = layer.bias.detach().index_select(0, keep) if dim == 0 else layer.bias.detach()
+        new_layer.bias.data.copy_(bias)
+    return new_layer.to(layer.weight.device)
+
+
+def _slice_batch_norm(bn, keep):
+    new_bn = nn.BatchNorm1d(len(keep), eps=bn.eps, momentum=bn.momentum, affine=bn.affine,
+                            track_running_stats=bn.track_running_stats)
+    if bn.affine:
+        new_bn.weight.data.copy_(bn.weight.detach()[keep])
+        new_bn.bias.data.copy_(bn.bias.detach()[keep])
+    if bn.track_running_stats:
+        new_bn.running_mean.copy_(bn.running_mean[keep])
+        new_bn.running_var.copy_(bn.running_var[keep])
+        new_bn.num_batches_tracked.copy_(bn.num_batches_tracked)
+    return new_bn.to(bn.running_mean.device if bn.track_running_stats else bn.weight.device)
+
+
+def prune_units(model, importances, fraction, min_units=4):
+    """Entfernt in jeder Gruppe den Anteil `fraction` der Einheiten mit der geringsten Wichtigkeit (in-place)."""
+    for group, importance in zip(prunable_groups(model), importances):
+        producer = getattr(*group["producer"])
+        n_units = producer.weight.shape[0]
+        n_keep = max(min_units, int(round(n_units * (1 - fraction))))
+        if n_keep >= n_units:
+            continue
+        keep = torch.sort(torch.argsort(importance, descending=True)[:n_keep]).values.to(producer.weight.device)
+        setattr(*group["producer"], _slice_layer(producer, keep, dim=0))
+        if group["bn"] is not None:
+            setattr(*group["bn"], _slice_batch_norm(getattr(*group["bn"]), keep))
+        # Bei der Flatten-Schnittstelle zum fc-Layer gehören zu jedem Kanal `flatten` aufeinanderfolgende Inputs
+        flatten = group["flatten"]
+        consumer_keep = (keep.unsqueeze(1) * flatten + torch.arange(flatten, device=keep.device)).reshape(-1)
+        setattr(*group["consumer"], _slice_layer(getattr(*group["consumer"]), consumer_keep, dim=1))
+    return model
+
+
+def _targets_met(model, example_inputs, target_params, target_latency_ms):
+    n_params = count_parameters(model)
+    latency = measure_latency(model, example_inputs, n_runs=20)
+    met = (target_params is None or n_params <= target_params) and \
+          (target_latency_ms is None or latency <= target_latency_ms)
+    return met, n_params, latency
+
+
+def prune_model(model, train_loader, val_loader, experiments_dir_path, target_params=None, target_latency_ms=None,
+                method="magnitude", step=0.2, finetune_epochs=1, learning_rate=1e-4, max_iterations=10):
+    """
+    Strukturiertes Pruning eines trainierten CNNModel/MLPModel bis zum Parameter- oder CPU-Latenzbudget.
+
+    In jeder Iteration wird ein Anteil `step` der Kanäle/Neuronen je Layer nach Magnitude oder Sensitivität
+    (auf dem Validierungssplit) entfernt und das Modell kurz nachtrainiert. Das Ergebnis ist ein physisch
+    kleineres, dichtes Modell.
+    """
+    experiments_dir_path = Path(experiments_dir_path)
+    criterion = nn.L1Loss()
+    model.to(device)
+    example_inputs = next(iter(val_loader))[0].to(torch.float32).to(device)
+    original_loss = test_model(experiments_dir_path, model, val_loader, criterion, save=False)
+    _, original_params, original_latency = _targets_met(model, example_inputs, target_params, target_latency_ms)
+
+    pruned = copy.deepcopy(model)
+    for iteration in range(max_iterations):
+        met, n_params, latency = _targets_met(pruned, example_inputs, target_params, target_latency_ms)
+        if met:
+            break
+        if method == "sensitivity":
+            importances = sensitivity_importance(pruned, val_loader, criterion)
+        else:
+            importances = magnitude_importance(pruned)
+        prune_units(pruned, importances, step)
+        optimizer = torch.optim.Adam(pruned.parameters(), lr=learning_rate, weight_decay=1e-2)
+        for _ in range(finetune_epochs):
+            train_model(pruned, train_loader, optimizer, criterion)
+        logging.warning(f"Pruning Iteration {iteration + 1}: {architecture(pruned)}, {count_parameters(pruned)} Parameter")
+    else:
+        logging.warning("Maximale Anzahl an Pruning-Iterationen erreicht, ohne das Budget einzuhalten.")
+
+    pruned_loss = test_model(experiments_dir_path, pruned, val_loader, criterion, save=False)
+    _, pruned_params, pruned_latency = _targets_met(pruned, example_inputs, target_params, target_latency_ms)
+    report = {
+        "method": method,
+        "architecture": architecture(pruned),
+        "original_parameters": original_params,
+        "pruned_parameters": pruned_params,
+        "original_latency_ms": original_latency,
+        "pruned_latency_ms": pruned_latency,
+        "original_val_loss": float(original_loss),
+        "pruned_val_loss": float(pruned_loss),
+        "val_loss_change": float(pruned_loss - original_loss),
+    }
+    logging.warning(f"Pruning Report: {report}")
+    torch.save(pruned.state_dict(), experiments_dir_path / "model_pruned.pt")
+    with open(experiments_dir_path / "pruning.json", "w") as f:
+        json.dump(report, f)
+    return pruned, report
+
+
+if __name__ == "__main__":
+    root = Path("../experiments/Test_Run_with_dummy_data/")
+    directory = root/"CNN/"
+    with open(root/"config.json", "r") as f:
+        config = json.load(f)
+
+    model = CNNModel(sequence_length=config["time_horizon"],n_layers = config["n_layers"], batch_norm = config["batch_norm"],
+                     dropout_rate= config["dropout"], kernel_size=config["kernel_size"], size_out=config["time_horizon"],
+                     pool=config["pool"])
+    model.load_state_dict(torch.load(best_checkpoint_path(directory)))
+
+    train_dataset, val_dataset, _ = import_data(time_horizon=config["time_horizon"], test_run=config["test_run"])
+    train_loader = DataLoader(train_dataset, batch_size=config["batch_size"], shuffle=True, drop_last=True)
+    val_loader = DataLoader(val_dataset, batch_size=config["batch_size"], shuffle=False, drop_last=True)
+    prune_model(model, train_loader, val_loader, directory, target_params=count_parameters(model) // 2)
@@ -0,0 +1,89 @@
+import numpy as np
+import torch
+from sklearn.cluster import KMeans
+from torch.utils.data import Sampler, Subset
+
+
+class SetupImportanceSampler(Sampler):
+    """
+    Zieht die Trainings-Samples einer Epoche gewichtet nach Regelparameter-Setup.
+
+    Die Setups werden per k-Means über ihre Rücklauftemperatur-Verläufe geclustert; jeder Cluster erhält
+    zunächst dieselbe Masse, sodass viele nahezu identische Setups zusammen nicht mehr Gewicht haben als ein
+    einzelnes abweichendes. Innerhalb dieser Gewichtung wird nach dem aktuellen (gleitend gemittelten) Verlust
+    je Setup verstärkt (`loss_exponent`). Ein Anteil `uniform_share` wird gleichverteilt gezogen, damit alle
+    Setups abgedeckt bleiben. Pro Epoche werden `fraction` * len(dataset) Samples mit Zurücklegen gezogen.
+
+    Die Verluste liefert `train_model` über `record`; sie werden pro Batch auf dem Rechengerät gesammelt und
+    erst zu Beginn der nächsten Epoche übernommen. Ein Sample wird dem Setup seines ersten Zeitschritts zugeordnet.
+    """
+    def __init__(self, dataset, fraction=0.5, uniform_share=0.2, n_clusters=16, loss_exponent=1.0, momentum=0.5,
+                 seed=0):
+        base = dataset.dataset if isinstance(dataset, Subset) else dataset
+        indices = np.asarray(dataset.indices) if isinstance(dataset, Subset) else np.arange(len(dataset))
+        rows_per_setup = base.time_series_inputs.shape[0]
+        n_setups = base.regelparams.shape[0]
+        self.sample_setups = np.minimum(indices * base.time_horizon // rows_per_setup, n_setups - 1)
+        self.num_samples = max(1, int(round(fraction * len(dataset))))
+        self.uniform_share = uniform_share
+        self.loss_exponent = loss_exponent
+        self.momentum = momentum
+        self.generator = torch.Generator().manual_seed(seed)
+
+        # Diversität: gleiche Masse je Cluster ähnlicher Target-Verläufe
+        curves = np.asarray(base.flattened_targets, dtype=np.float64).reshape(n_setups, rows_per_setup)
+        n_clusters = min(n_clusters, n_setups)
+        self.clusters = KMeans(n_clusters=n_clusters, n_init=4, random_state=seed).fit_predict(curves)
+        cluster_sizes = np.bincount(self.clusters, minlength=n_clusters)
+        self.diversity_weights = 1.0 / cluster_sizes[self.clusters]
+
+        self.samples_per_setup = np.bincount(self.sample_setups, minlength=n_setups)
+        self.setup_losses = np.full(n_setups, np.nan)
+        self.epoch_indices = np.array([], dtype=np.int64)
+        self._recorded = []
+
+    def setup_probabilities(self):
+        """Aktuelle Ziehungswahrscheinlichkeit je Setup (nur Setups mit Samples im Datensatz)."""
+        present = self.samples_per_setup > 0
+        losses = self.setup_losses.copy()
+        # Noch nicht gesehene Setups erhalten den mittleren Verlust der gesehenen
+        losses[np.isnan(losses)] = np.nanmean(losses) if not np.all(np.isnan(losses)) else 1.0
+        scores = self.diversity_weights * np.maximum(losses, 1e-12) ** self.loss_exponent * present
+        uniform = present / present.sum()
+        return (1 - self.uniform_share) * scores / scores.sum() + self.uniform_share * uniform
+
+    def record(self, sample_losses):
+        """Nimmt die Verluste je Sample des nächsten Batches auf (in der Reihenfolge der gezogenen Indizes)."""
+        self._recorded.append(sample_losses.detach())
+
+    def _update_losses(self):
+        if not self._recorded:
+            return
+        losses = torch.cat(self._recorded).float().cpu().numpy()
+        self._recorded = []
+        setups = self.sample_setups[self.epoch_indices[:len(losses)]]
+        sums = np.bincount(setups, weights=losses, minlength=len(self.setup_losses))
+        counts = np.bincount(setups, minlength=len(self.setup_losses))
+        seen = counts > 0
+        epoch_losses = sums[seen] / counts[seen]
+        previous = self.setup_losses[seen]
+        self.setup_losses[seen] = np.where(np.isnan(previous), epoch_losses,
+                                           self.momentum * previous + (1 - self.momentum) * epoch_losses)
+
+    def __iter__(self):
+        self._update_losses()
+        sample_weights = self.setup_probabilities()[self.sample_setups] / self.samples_per_setup[self.sample_setups]
+        self.epoch_indices = torch.multinomial(torch.as_tensor(sample_weights), self.num_samples, replacement=True,
+                                               generator=self.generator).numpy()
+        return iter(self.epoch_indices.tolist())
+
+    def __len__(self):
+        return self.num_samples
+
+    def state_dict(self):
+        self._update_losses()
+        return {"setup_losses": self.setup_losses.copy(), "generator": self.generator.get_state()}
+
+    def load_state_dict(self, state_dict):
+        self.setup_losses = np.array(state_dict["setup_losses"])
+        self.generator.set_state(state_dict["generator"])
@@ -0,0 +1,105 @@
+import json
+import logging
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dataset import import_data
+from distributed import init_distributed, get_world_size, cleanup_distributed
+from models import build_model
+from training import train_and_optimize
+from utils import set_seed
+
+
+def _run_worker(output_dir):
+    """Ein Prozess eines Benchmark-Laufs (über torchrun gestartet): trainiert ohne abschließende Evaluation."""
+    output_dir = Path(output_dir)
+    with open(output_dir / "config.json") as f:
+        config = json.load(f)
+    init_distributed()
+    train_dataset, val_dataset, test_dataset = import_data(time_horizon=config["time_horizon"],
+                                                           test_run=config["test_run"])
+    set_seed(config["seed"])
+    model = build_model(config, input_dim=train_dataset.input_dim())
+    train_and_optimize(train_dataset, val_dataset, output_dir / f"world_{get_world_size()}", model, config,
+                       test_dataset=test_dataset)
+    cleanup_distributed()
+
+
+def scaling_report(output_dir):
+    """
+    Vergleicht den Trainingsdurchsatz der Läufe `world_*/throughput.json` in `output_dir`.
+
+    Die erste Epoche (Aufwärmen) wird nicht gewertet, sofern mehrere Epochen vorliegen. Speedup und Effizienz
+    beziehen sich auf den Lauf mit der kleinsten Anzahl an Prozessen; die Tabelle wird als `scaling_report.csv`
+    gespeichert.
+    """
+    output_dir = Path(output_dir)
+    rows = []
+    for path in output_dir.glob("world_*/throughput.json"):
+        with open(path) as f:
+            throughput = json.load(f)
+        samples_per_second = throughput["samples_per_second"]
+        if len(samples_per_second) > 1:
+            samples_per_second = samples_per_second[1:]
+        rows.append({"world_size": throughput["world_size"],
+                     "batch_size_per_process": throughput["batch_size_per_process"],
+                     "samples_per_second": float(np.mean(samples_per_second))})
+    if not rows:
+        raise ValueError(f"Keine throughput.json unter {output_dir}")
+    report = pd.DataFrame(rows).sort_values("world_size").reset_index(drop=True)
+    base = report.iloc[0]
+    report["speedup"] = report["samples_per_second"] / base["samples_per_second"]
+    report["efficiency"] = report["speedup"] / (report["world_size"] / base["world_size"])
+    report.to_csv(output_dir / "scaling_report.csv", index=False)
+    logging.warning("Skalierung des Durchsatzes:\n" + report.to_string(index=False, float_format="%.2f"))
+    return report
+
+
+def run_scaling_benchmark(output_dir, config, world_sizes=(1, 2, 4)):
+    """
+    Trainiert dieselbe Konfiguration nacheinander mit `world_sizes` Prozessen (torchrun, ein Knoten) und erstellt
+    anschließend den Skalierungsbericht (`scaling_report`).
+
+    Abschließende Evaluation, Trainings-Cache und Experiment-Datenbank sind für die Benchmark-Läufe abgeschaltet,
+    damit nur das Training gemessen wird.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    config = {**config, "final_evaluation": False, "training_cache": None, "experiment_db": None,
+              "objective_cache": None, "profile": False, "resume": False}
+    with open(output_dir / "config.json", "w") as f:
+        json.dump(config, f)
+    for world_size in world_sizes:
+        shutil.rmtree(output_dir / f"world_{world_size}", ignore_errors=True)
+        logging.warning(f"Benchmark mit {world_size} Prozess(en)")
+        subprocess.run([sys.executable, "-m", "torch.distributed.run", "--standalone",
+                        f"--nproc_per_node={world_size}", __file__, "--worker", str(output_dir)], check=True)
+    return scaling_report(output_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        _run_worker(sys.argv[2])
+        sys.exit(0)
+    config = {
+        "batch_size": 64,
+        "epochs": 3,
+        "time_horizon": 150,
+        "n_layers": 5,
+        "batch_norm": False,
+        "dropout": 0.5,
+        "learning_rate": 0.001,
+        "kernel_size": 5,
+        "pool": False,
+        "test_run": True,
+        "early_stopping_patience": None,
+        "lr_scheduler": "plateau",
+        "mixed_precision": False,
+        "seed": 0,
+    }
+    run_scaling_benchmark(Path("../experiments") / "Scaling_with_dummy_data", config, world_sizes=(1, 2, 4))
@@ -0,0 +1,119 @@
+import json
+import logging
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from optimze_regel_params import predict_outputs_for_regelparams, device
+from utils import bf16_autocast
+
+BETRIEBSART_LABELS = {1: "Tag", 0: "Nacht", -1: "unbekannt"}
+
+
+def regelparam_grid(dataset, step_m=0.1, step_l=0.5):
+    """Gitter über Steigung und Level in den Grenzen der Setups (wie in der Grid Search)."""
+    min_m, min_l = np.min(dataset.regelparams, axis=0)
+    max_m, max_l = np.max(dataset.regelparams, axis=0)
+    return np.array(list(product(np.round(np.arange(min_m, max_m + step_m, step_m), 2),
+                                 np.round(np.arange(min_l, max_l + step_l, step_l), 2))))
+
+
+def operating_segments(dataset, n_bands=4, band_edges=None):
+    """
+    Ordnet jeden Zeitschritt der Zeitreihe einem Segment aus Außentemperaturband und Betriebsart zu.
+
+    Ohne `band_edges` werden die Bänder an den Quantilen der Außentemperatur getrennt (`n_bands` gleich volle Bänder).
+    :return: Segment-ID je Zeitschritt und Tabelle der (vorhandenen) Segmente.
+    """
+    temperature = dataset.outdoor_temperature
+    if band_edges is None:
+        band_edges = np.unique(np.quantile(temperature, np.linspace(0, 1, n_bands + 1)[1:-1]))
+    band_edges = np.asarray(band_edges, dtype=np.float64)
+    bands = np.digitize(temperature, band_edges)
+    modes = np.where(np.isnan(dataset.betriebsart), -1, dataset.betriebsart).astype(int)
+    keys = sorted(set(zip(bands.tolist(), modes.tolist())))
+    lookup = {key: i for i, key in enumerate(keys)}
+    segment_ids = np.array([lookup[key] for key in zip(bands.tolist(), modes.tolist())])
+    lower = np.concatenate([[-np.inf], band_edges])
+    upper = np.concatenate([band_edges, [np.inf]])
+    segments = pd.DataFrame([{"segment": i, "t_aussen_min": lower[band], "t_aussen_max": upper[band],
+                              "betriebsart": BETRIEBSART_LABELS[mode], "n_zeitschritte": int(np.sum(segment_ids == i))}
+                             for i, (band, mode) in enumerate(keys)])
+    return segment_ids, segments
+
+
+def _predictions_per_row(outputs, dataset):
+    """(n, len, output_dim) -> (n, len * time_horizon): eine Vorhersage je Zeile der Datensatz-Inputs."""
+    if outputs.shape[-1] != dataset.time_horizon:
+        raise ValueError("Die Fahrplan-Optimierung benötigt ein Modell mit einer Vorhersage je Zeitschritt "
+                         f"(output_dim {outputs.shape[-1]} != time_horizon {dataset.time_horizon})")
+    return outputs.reshape(outputs.shape[0], -1)
+
+
+def predict_ruecklauftemp_schedules(model, dataset, schedules, schedules_per_pass=4, mixed_precision=False):
+    """Mittlere vorhergesagte Rücklauftemperatur je Fahrplan (Regelparameter je Zeitschritt)."""
+    schedules = np.asarray(schedules, dtype=np.float32)
+    model = model.to(device)
+    model.eval()
+    means = []
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision):
+        for start in range(0, schedules.shape[0], schedules_per_pass):
+            inputs = torch.from_numpy(dataset.inputs_for_schedule(schedules[start:start + schedules_per_pass]))
+            outputs = model(inputs.to(device)).float().cpu().numpy()
+            means.append(outputs.reshape(-1, len(dataset) * outputs.shape[-1]).mean(axis=1))
+    return np.concatenate(means)
+
+
+def optimize_schedule(model, dataset, n_bands=4, band_edges=None, grid=None, params_per_pass=8, mixed_precision=False):
+    """
+    Bestimmt Steigung und Level je Segment (Außentemperaturband x Betriebsart).
+
+    Alle Gitterpunkte werden in einem gebatchten Durchlauf über den gesamten Datensatz ausgewertet; daraus wird für
+    jedes Segment der Gitterpunkt mit der geringsten mittleren Rücklauftemperatur in den Zeitschritten dieses Segments
+    gewählt. Da das Modell über Fenster von `time_horizon` Schritten rechnet, können benachbarte Segmente einander
+    beeinflussen; der zusammengesetzte Fahrplan wird deshalb abschließend als Ganzes ausgewertet und mit dem besten
+    einheitlichen Regelparameter-Paar verglichen.
+    :return: Fahrplan-Tabelle (DataFrame) und Zusammenfassung (dict).
+    """
+    segment_ids, segments = operating_segments(dataset, n_bands=n_bands, band_edges=band_edges)
+    grid = regelparam_grid(dataset) if grid is None else np.asarray(grid, dtype=np.float64)
+    model.eval()
+    predictions = _predictions_per_row(predict_outputs_for_regelparams(model, dataset, grid, params_per_pass=params_per_pass,
+                                                                       mixed_precision=mixed_precision), dataset)
+    rows_per_setup = dataset.time_series_inputs.shape[0]
+    row_segments = segment_ids[np.arange(predictions.shape[1]) % rows_per_setup]
+    # Mittlere Rücklauftemperatur je Gitterpunkt und Segment, Form (n_grid, n_segments)
+    segment_means = np.stack([predictions[:, row_segments == s].mean(axis=1) for s in range(len(segments))], axis=1)
+    best_per_segment = np.argmin(segment_means, axis=0)
+    best_global = int(np.argmin(predictions.mean(axis=1)))
+
+    segments["Steigung"] = grid[best_per_segment, 0]
+    segments["Level"] = grid[best_per_segment, 1]
+    segments["ruecklauftemp_segment"] = segment_means[best_per_segment, np.arange(len(segments))]
+    segments["ruecklauftemp_einheitlich"] = segment_means[best_global]
+
+    schedule = grid[best_per_segment][segment_ids]
+    uniform = np.repeat(grid[best_global][np.newaxis], rows_per_setup, axis=0)
+    schedule_temp, uniform_temp = predict_ruecklauftemp_schedules(model, dataset, [schedule, uniform],
+                                                                  mixed_precision=mixed_precision)
+    summary = {"n_segments": len(segments), "n_grid_points": len(grid),
+               "uniform_params": grid[best_global].tolist(),
+               "ruecklauftemp_fahrplan": float(schedule_temp), "ruecklauftemp_einheitlich": float(uniform_temp),
+               "verbesserung": float(uniform_temp - schedule_temp)}
+    logging.warning(f"Fahrplan mit {len(segments)} Segmenten: {schedule_temp:.4f} gegenüber {uniform_temp:.4f} "
+                    f"mit einheitlichen Regelparametern {grid[best_global].tolist()}")
+    return segments, summary
+
+
+def optimize_schedule_for_trained_model(model, dataset, root, n_bands=4, band_edges=None, mixed_precision=False):
+    """Optimiert den Fahrplan und exportiert ihn als `schedule.csv` (Zusammenfassung in `schedule.json`)."""
+    segments, summary = optimize_schedule(model, dataset, n_bands=n_bands, band_edges=band_edges,
+                                          mixed_precision=mixed_precision)
+    root = Path(root)
+    segments.to_csv(root / "schedule.csv", index=False)
+    with open(root / "schedule.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    return segments, summary
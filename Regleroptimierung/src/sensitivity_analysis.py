@@ -0,0 +1,175 @@
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+from scipy.stats import qmc
+
+from optimze_regel_params import device
+from profiling import profiled
+from utils import bf16_autocast
+
+
+def default_factors(dataset):
+    """
+    Standard-Faktoren der Sensitivitätsanalyse mit ihren Grenzen.
+
+    Steigung und Level werden als absolute Werte in den Grenzen der Setups variiert, exogene Inputs (hier die
+    Außentemperatur) als additive Verschiebung in physikalischen Einheiten.
+    """
+    min_m, min_l = np.min(dataset.regelparams, axis=0)
+    max_m, max_l = np.max(dataset.regelparams, axis=0)
+    return {"Steigung": (float(min_m), float(max_m)), "Level": (float(min_l), float(max_l)),
+            "mbr10AussentemperaturAf1": (-5.0, 5.0)}
+
+
+def _factor_columns(dataset, names):
+    """Spaltenindex, Art (Regelparameter oder exogen) und Skalierungsfaktor des MinMaxScalers je Faktor."""
+    n_param_columns = dataset.regelparams.shape[1]
+    columns = []
+    for name in names:
+        if name not in dataset.input_columns:
+            raise ValueError(f"Unbekannter Faktor {name}, erlaubt sind {dataset.input_columns}")
+        index = dataset.input_columns.index(name)
+        is_param = index >= len(dataset.input_columns) - n_param_columns
+        columns.append((index, is_param, 1.0 if is_param else float(dataset.scaler_inputs.scale_[index])))
+    return columns
+
+
+@profiled("sensitivity_forward")
+def evaluate_samples(model, dataset, samples, names, n_windows=None, samples_per_pass=256, mixed_precision=False):
+    """
+    Mittlere vorhergesagte Rücklauftemperatur je Stichprobe von Faktorwerten.
+
+    Da sich die Setups nur in den Regelparametern unterscheiden und diese ersetzt werden, genügen die ersten
+    `n_windows` Fenster des Datensatzes (Standard: so viele, dass die Zeitreihe einmal abgedeckt ist). Jeweils
+    `samples_per_pass` Stichproben werden in einem gemeinsamen Forward-Pass ausgewertet. Verschiebungen exogener
+    Inputs können die skalierten Werte aus [0, 1] heraus führen, das Modell extrapoliert dann.
+    :param samples: Array der Form (n_samples, len(names)) in physikalischen Einheiten.
+    :return: Array der Form (n_samples,).
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1, len(names))
+    columns = _factor_columns(dataset, names)
+    if n_windows is None:
+        n_windows = -(-dataset.time_series_inputs.shape[0] // dataset.time_horizon)
+    n_windows = min(n_windows, len(dataset))
+    base = dataset.final_inputs[:n_windows * dataset.time_horizon].astype(np.float32)
+    model = model.to(device)
+    means = []
+    with torch.no_grad(), bf16_autocast(device, enabled=mixed_precision):
+        for start in range(0, samples.shape[0], samples_per_pass):
+            chunk = samples[start:start + samples_per_pass]
+            inputs = np.repeat(base[np.newaxis], chunk.shape[0], axis=0)
+            for j, (index, is_param, scale) in enumerate(columns):
+                if is_param:
+                    inputs[:, :, index] = chunk[:, j:j + 1]
+                else:
+                    inputs[:, :, index] += chunk[:, j:j + 1] * scale
+            inputs = torch.from_numpy(inputs.reshape(-1, dataset.time_horizon, dataset.input_dim()))
+            outputs = model(inputs.to(device)).float().cpu().numpy()
+            means.append(outputs.reshape(chunk.shape[0], -1).mean(axis=1))
+    return np.concatenate(means).astype(np.float64)
+
+
+def _sobol_estimates(f_a, f_b, f_ab):
+    """Indizes erster Ordnung (Saltelli 2010) und totale Indizes (Jansen) aus den Auswertungen von A, B und AB_i."""
+    variance = np.var(np.concatenate([f_a, f_b]))
+    if variance == 0:
+        return np.zeros(len(f_ab)), np.zeros(len(f_ab))
+    first = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+    total = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    return first, total
+
+
+def sobol_indices(model, dataset, factors=None, n_samples=1024, n_bootstrap=100, seed=0, **eval_kwargs):
+    """
+    Sobol-Indizes der mittleren Rücklauftemperatur (Saltelli-Schema mit n_samples * (d + 2) Auswertungen).
+
+    Die Matrizen A und B stammen aus einer verwürfelten Sobol-Folge; alle Auswertungen laufen gebatcht über
+    `evaluate_samples`. Konfidenzintervalle (95 %) per Bootstrap über die Stichproben.
+    :param factors: dict Name -> (untere, obere Grenze), Standard siehe `default_factors`.
+    :return: DataFrame mit S1, S1_conf, ST und ST_conf je Faktor.
+    """
+    factors = default_factors(dataset) if factors is None else factors
+    names = list(factors)
+    d = len(names)
+    lower, upper = np.array([factors[name] for name in names], dtype=np.float64).T
+    # Zweierpotenz, damit die Sobol-Folge ihre Balance-Eigenschaften behält
+    n_samples = 2 ** int(np.ceil(np.log2(n_samples)))
+    unit = qmc.Sobol(d=2 * d, scramble=True, seed=seed).random(n_samples)
+    a, b = unit[:, :d], unit[:, d:]
+    ab = np.repeat(a[np.newaxis], d, axis=0)
+    for i in range(d):
+        ab[i, :, i] = b[:, i]
+    unit_samples = np.concatenate([a, b, ab.reshape(-1, d)])
+
+    start = time.monotonic()
+    values = evaluate_samples(model, dataset, lower + unit_samples * (upper - lower), names, **eval_kwargs)
+    f_a, f_b, f_ab = values[:n_samples], values[n_samples:2 * n_samples], values[2 * n_samples:].reshape(d, n_samples)
+    first, total = _sobol_estimates(f_a, f_b, f_ab)
+
+    rng = np.random.default_rng(seed)
+    bootstrap = [_sobol_estimates(f_a[idx], f_b[idx], f_ab[:, idx])
+                 for idx in rng.integers(0, n_samples, size=(n_bootstrap, n_samples))]
+    first_conf = 1.96 * np.std([first_b for first_b, _ in bootstrap], axis=0) if bootstrap else np.full(d, np.nan)
+    total_conf = 1.96 * np.std([total_b for _, total_b in bootstrap], axis=0) if bootstrap else np.full(d, np.nan)
+    logging.warning(f"Sobol-Analyse: {len(values)} Auswertungen in {time.monotonic() - start:.1f} s")
+    return pd.DataFrame({"factor": names, "S1": first, "S1_conf": first_conf, "ST": total, "ST_conf": total_conf})
+
+
+def morris_elementary_effects(model, dataset, factors=None, n_trajectories=64, n_levels=4, seed=0, **eval_kwargs):
+    """
+    Morris-Screening mit `n_trajectories` Trajektorien zu je d + 1 Punkten auf einem Gitter mit `n_levels` Stufen.
+
+    Die Elementareffekte sind auf die Spannweite der Faktoren normiert (Änderung der Rücklauftemperatur bei
+    Variation über die volle Spannweite).
+    :return: DataFrame mit mu, mu_star und sigma je Faktor.
+    """
+    factors = default_factors(dataset) if factors is None else factors
+    names = list(factors)
+    d = len(names)
+    lower, upper = np.array([factors[name] for name in names], dtype=np.float64).T
+    rng = np.random.default_rng(seed)
+    delta = n_levels / (2 * (n_levels - 1))
+    grid_levels = np.arange(n_levels) / (n_levels - 1)
+
+    points = np.empty((n_trajectories, d + 1, d))
+    orders = np.empty((n_trajectories, d), dtype=int)
+    steps = np.empty((n_trajectories, d))
+    for t in range(n_trajectories):
+        x = rng.choice(grid_levels, size=d)
+        orders[t] = rng.permutation(d)
+        points[t, 0] = x
+        for k, i in enumerate(orders[t]):
+            steps[t, i] = delta if x[i] + delta <= 1 + 1e-9 else -delta
+            x[i] += steps[t, i]
+            points[t, k + 1] = x
+
+    start = time.monotonic()
+    values = evaluate_samples(model, dataset, lower + points.reshape(-1, d) * (upper - lower), names,
+                              **eval_kwargs).reshape(n_trajectories, d + 1)
+    effects = np.empty((n_trajectories, d))
+    for t in range(n_trajectories):
+        for k, i in enumerate(orders[t]):
+            effects[t, i] = (values[t, k + 1] - values[t, k]) / steps[t, i]
+    logging.warning(f"Morris-Screening: {values.size} Auswertungen in {time.monotonic() - start:.1f} s")
+    return pd.DataFrame({"factor": names, "mu": effects.mean(axis=0), "mu_star": np.abs(effects).mean(axis=0),
+                         "sigma": effects.std(axis=0, ddof=1) if n_trajectories > 1 else np.zeros(d)})
+
+
+def sensitivity_for_trained_model(model, dataset, root, factors=None, n_samples=1024, mixed_precision=False):
+    """Führt Sobol- und Morris-Analyse durch und speichert beide Tabellen in `sensitivity.json`."""
+    model.eval()
+    sobol = sobol_indices(model, dataset, factors=factors, n_samples=n_samples, mixed_precision=mixed_precision)
+    morris = morris_elementary_effects(model, dataset, factors=factors, mixed_precision=mixed_precision)
+    factors = default_factors(dataset) if factors is None else factors
+    result = {"factors": {name: list(bounds) for name, bounds in factors.items()},
+              "sobol": sobol.to_dict("records"), "morris": morris.to_dict("records")}
+    with open(Path(root) / "sensitivity.json", "w") as f:
+        json.dump(result, f, indent=2)
+    logging.warning("Sensitivität (Sobol ST): " + ", ".join(f"{row['factor']} {row['ST']:.3f}"
+                                                              for row in result["sobol"]))
+    return sobol, morris
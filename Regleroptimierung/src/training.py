@@ -1,15 +1,30 @@
 import json
 import logging
+import time
 from pathlib import Path
 from torch.utils.data import DataLoader, random_split, Subset
+from torch.utils.data.distributed import DistributedSampler
+from torch.nn.parallel import DistributedDataParallel
 
 import numpy as np
 import torch
 import torch.nn as nn
-from dataset import import_data
+from dataset import import_data, datasets_content_hash
 from models import MLPModel, CNNModel, LSTMModel
-from utils import save_losses_and_model, plot_losses, setup_logging, save_predictions
-from optimze_regel_params import  optimize_regelparams_for_trained_model
+from utils import save_losses_and_model, plot_losses, setup_logging, CheckpointManager, best_checkpoint_path, \
+    set_seed, capture_rng_state, restore_rng_state, load_training_state, bf16_autocast, PredictionWriter, compress_predictions
+from optimze_regel_params import  optimize_regelparams_for_trained_model, set_objective_cache
+from objective_cache import ObjectiveCache
+from metrics import MetricsAccumulator
+from experiment_store import ExperimentStore
+from training_cache import TrainingCache, run_fingerprint, clear_run_artifacts
+from sampling import SetupImportanceSampler
+from schedule_optimization import optimize_schedule_for_trained_model
+from pareto_optimization import pareto_front_for_trained_model
+from sensitivity_analysis import sensitivity_for_trained_model
+from profiling import RunProfiler, set_active_profiler, profiled, profile_stage, profile_epoch, profiled_batches
+from distributed import init_distributed, is_distributed, is_main_process, get_world_size, reduce_mean, all_reduce_mean, broadcast_object, \
+    barrier, cleanup_distributed
 from datetime import datetime
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -17,107 +32,416 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 setup_logging()
 
-def train_and_optimize(train_dataset, val_dataset,experiments_dir_path,model, config, save_train_pred = True):
-    """Führt das Training des Modells und die anschließende Regelparameter-Optimierung durch."""
-    experiments_dir_path.mkdir(parents=True)
+class EarlyStopping:
+    """Signalisiert den Abbruch, wenn sich der Validierungsverlust `patience` Epochen lang nicht um mindestens `min_delta` verbessert."""
+    def __init__(self, patience, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = float("inf")
+        self.counter = 0
+
+    def step(self, val_loss):
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.counter = 0
+        else:
+            self.counter += 1
+        return self.counter >= self.patience
+
+    def state_dict(self):
+        return {"best_loss": self.best_loss, "counter": self.counter}
+
+    def load_state_dict(self, state_dict):
+        self.best_loss = state_dict["best_loss"]
+        self.counter = state_dict["counter"]
+
+def build_lr_scheduler(optimizer, config):
+    """Erzeugt den in der Konfiguration gewählten Lernraten-Scheduler ("plateau", "cosine" oder None)."""
+    scheduler = config.get("lr_scheduler")
+    if scheduler is None:
+        return None
+    if scheduler == "plateau":
+        return torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=config.get("lr_factor", 0.5),
+                                                          patience=config.get("lr_patience", 3),
+                                                          min_lr=config.get("min_learning_rate", 0.0))
+    if scheduler == "cosine":
+        return torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=config["epochs"],
+                                                          eta_min=config.get("min_learning_rate", 0.0))
+    raise ValueError(f"Unbekannter Lernraten-Scheduler: {scheduler}")
+
+def record_cached_run(db_path, experiments_dir_path, config, cached_result, data_hash=None, model_name=None,
+                      wall_time_s=None):
+    """Protokolliert einen aus dem Trainings-Cache übernommenen Lauf mit Status "cached" im `ExperimentStore`."""
+    train_losses, val_losses, _, test_loss = cached_result
+    store = ExperimentStore(db_path)
+    run_id = store.start_run(experiments_dir_path, config, data_hash=data_hash, model=model_name)
+    for epoch, (train_loss, val_loss) in enumerate(zip(train_losses, val_losses)):
+        store.log_epoch(run_id, epoch, train_loss, val_loss)
+    store.finish_run(run_id, status="cached", best_checkpoint=best_checkpoint_path(experiments_dir_path),
+                     test_loss=test_loss, wall_time_s=wall_time_s)
+    store.close()
+
+
+def train_and_optimize(train_dataset, val_dataset,experiments_dir_path,model, config, save_train_pred = False, test_dataset = None):
+    """Führt das Training des Modells und die anschließende Regelparameter-Optimierung durch.
+
+    Existiert im Verzeichnis bereits ein Trainingszustand (`training_state.pt`), wird das Training dort fortgesetzt
+    (abschaltbar über `config["resume"] = False`). Gehört der gespeicherte Zustand zu einer anderen Konfiguration,
+    anderen Daten oder einer anderen Modellarchitektur (`run_fingerprint`), wird neu begonnen und die Checkpoints
+    des alten Laufs werden entfernt.
+
+    Wurde `init_distributed` aufgerufen (Start über torchrun), wird mit DistributedDataParallel trainiert:
+    `batch_size` gilt pro Prozess, Verluste werden über alle Prozesse gemittelt und nur Rank 0 schreibt.
+
+    Ohne `test_dataset` wird der Validierungsdatensatz auch als Testdatensatz verwendet. Mit
+    `config["final_evaluation"] = False` entfallen Test-Evaluation und Regelparameter-Optimierung (z. B. in Sweeps).
+
+    Mit `config["experiment_db"]` (Pfad einer SQLite-Datei) werden Konfiguration, Daten-Hash, Metriken je Epoche,
+    Laufzeiten, bester Checkpoint und Optimierungsergebnisse im `ExperimentStore` protokolliert.
+
+    Mit `config["training_cache"]` (Verzeichnis) und gesetztem `seed` wird ein bereits abgeschlossener Lauf mit
+    gleicher Konfiguration, gleichen Daten und gleichem Code nicht erneut trainiert, sondern aus dem
+    `TrainingCache` übernommen; mit `experiment_db` wird ein solcher Lauf mit Status "cached" protokolliert.
+
+    Mit `config["importance_sampling"] = True` zieht ein `SetupImportanceSampler` die Trainings-Samples jeder
+    Epoche gewichtet nach Diversität und aktuellem Verlust der Regelparameter-Setups (nicht im verteilten Training).
+    """
+    try:
+        return _train_and_optimize(train_dataset, val_dataset, experiments_dir_path, model, config,
+                                   save_train_pred=save_train_pred, test_dataset=test_dataset)
+    finally:
+        # Auch bei Fehlern den Profiler abmelden, damit spätere Läufe im selben Prozess nicht hineinschreiben
+        set_active_profiler(None)
+
+
+def _train_and_optimize(train_dataset, val_dataset, experiments_dir_path, model, config, save_train_pred=False,
+                        test_dataset=None):
+    if test_dataset is None:
+        test_dataset = val_dataset
+    experiments_dir_path.mkdir(parents=True, exist_ok=True)
+    if config.get("seed") is not None:
+        set_seed(config["seed"])
     model.to(device)
+    data_hash = datasets_content_hash(train_dataset, val_dataset)
+    cache, cache_key = None, None
+    if config.get("training_cache") is not None:
+        cache = TrainingCache(config["training_cache"], max_entries=config.get("training_cache_max_entries", 20),
+                              max_age_days=config.get("training_cache_max_age_days"))
+        cache_key = cache.key(config, datasets_content_hash(train_dataset, val_dataset, test_dataset), model)
+        if cache_key is None:
+            logging.warning("Trainings-Cache wird ohne festen Seed nicht verwendet")
+        else:
+            load_start = time.monotonic()
+            cached_result = cache.load(cache_key, experiments_dir_path, model)
+            if cached_result is not None:
+                if config.get("experiment_db") is not None and is_main_process():
+                    record_cached_run(config["experiment_db"], experiments_dir_path, config, cached_result,
+                                      data_hash=data_hash,
+                                      model_name=type(model).__name__, wall_time_s=time.monotonic() - load_start)
+                return cached_result
     # Konfigurationsparameter laden
     epochs = config["epochs"]
     batch_size = config["batch_size"]
     learning_rate = config["learning_rate"]
     # DataLoader für Training, Validierung und Test erstellen
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, drop_last=True)
+    distributed = is_distributed()
+    train_sampler = DistributedSampler(train_dataset, shuffle=True, drop_last=True) if distributed else None
+    importance_sampler = None
+    if config.get("importance_sampling", False):
+        if distributed:
+            raise ValueError("importance_sampling wird im verteilten Training nicht unterstützt")
+        importance_sampler = SetupImportanceSampler(train_dataset, fraction=config.get("importance_fraction", 0.5),
+                                                    uniform_share=config.get("importance_uniform_share", 0.2),
+                                                    n_clusters=config.get("importance_n_clusters", 16),
+                                                    seed=config.get("seed") or 0)
+        train_sampler = importance_sampler
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=train_sampler is None, sampler=train_sampler,
+                              drop_last=True)
     val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, drop_last=True)
+    # Validierung je Epoche: im verteilten Fall wertet jeder Prozess nur seinen Teil aus, die Verluste werden
+    # anschließend über alle Prozesse zusammengeführt
+    epoch_val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, drop_last=True,
+                                  sampler=DistributedSampler(val_dataset, shuffle=False, drop_last=True)) \
+        if distributed else val_loader
     test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, drop_last=True)
     # Kriterium (Loss-Funktion) und Optimierer definieren (L1Loss = Mean Absolute Error)
     logging.warning(f"Training auf {len(train_dataset)} train samples und {len(val_loader)} validation batches")
 
     # Kriterium (Loss-Funktion) und Optimierer definieren (L1Loss = Mean Absolute Error)
     criterion = nn.L1Loss()
-    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate, weight_decay=1e-2)
+    # Im verteilten Fall synchronisiert der DDP-Wrapper die Gradienten, gespeichert wird das ungewrappte Modell
+    training_model = DistributedDataParallel(model) if distributed else model
+    optimizer = torch.optim.Adam(training_model.parameters(), lr=learning_rate, weight_decay=1e-2)
+    scheduler = build_lr_scheduler(optimizer, config)
+    # Early Stopping und Zeitbudget (in Sekunden) sind optional
+    early_stopping = None
+    if config.get("early_stopping_patience") is not None:
+        early_stopping = EarlyStopping(config["early_stopping_patience"], config.get("early_stopping_min_delta", 0.0))
+    max_training_time = config.get("max_training_time")
+    mixed_precision = config.get("mixed_precision", False)
 
     train_losses = []
     val_losses = []
-    if save_train_pred:
-        all_preds_train = []
-        all_targets_train = []
+    start_epoch = 0
+    elapsed_before_resume = 0.0
+    completed = False
+    time_budget_reached = False
+    fingerprint = run_fingerprint(config, data_hash, model)
+    training_state = load_training_state(experiments_dir_path) if config.get("resume", True) else None
+    # Rank 0 entscheidet, erst nachdem alle Prozesse den Zustand gelesen haben, wird er gegebenenfalls gelöscht
+    if broadcast_object(training_state is not None and training_state.get("fingerprint") != fingerprint):
+        logging.warning(f"Trainingszustand in {experiments_dir_path} gehört zu einer anderen Konfiguration, anderen "
+                        f"Daten oder einem anderen Modell und wird verworfen, das Training beginnt neu")
+        training_state = None
+        if is_main_process():
+            clear_run_artifacts(experiments_dir_path)
+    if training_state is not None:
+        model.load_state_dict(training_state["model"])
+        optimizer.load_state_dict(training_state["optimizer"])
+        if importance_sampler is not None and training_state.get("importance_sampler") is not None:
+            importance_sampler.load_state_dict(training_state["importance_sampler"])
+        if scheduler is not None and training_state["scheduler"] is not None:
+            scheduler.load_state_dict(training_state["scheduler"])
+        if early_stopping is not None and training_state["early_stopping"] is not None:
+            early_stopping.load_state_dict(training_state["early_stopping"])
+        train_losses = list(training_state["train_losses"])
+        val_losses = list(training_state["val_losses"])
+        start_epoch = training_state["epoch"] + 1
+        elapsed_before_resume = training_state["elapsed_time"]
+        completed = training_state["completed"]
+        restore_rng_state(training_state["rng"])
+        logging.warning(f"Setze Training aus {experiments_dir_path} nach Epoche {start_epoch} fort")
+    start_time = time.monotonic() - elapsed_before_resume
+    checkpoint_manager = None
+    if is_main_process():
+        checkpoint_manager = CheckpointManager(experiments_dir_path, keep_top_k=config.get("keep_top_k", 3))
+    throughputs = []
+    val_writer = PredictionWriter(experiments_dir_path, "val", n_samples=len(val_loader) * batch_size)
+    # Optionales Profiling (Laufzeiten je Stufe, Durchsatz, Peak-RSS) nach profile.json
+    profiler = None
+    if config.get("profile", False) and is_main_process():
+        profiler = RunProfiler(experiments_dir_path / "profile.json", trace_epochs=config.get("profile_epochs", []))
+        set_active_profiler(profiler)
+    store, run_id = None, None
+    if config.get("experiment_db") is not None and is_main_process():
+        store = ExperimentStore(config["experiment_db"])
+        run_id = store.start_run(experiments_dir_path, config, data_hash=data_hash,
+                                 model=type(model).__name__, resume=training_state is not None)
+    preds_train, targets_train = None, None
+
+    def finish_run(val_loss_final, test_loss=None, optimized_params=None):
+        # Profil, Experiment-Datenbank und Trainings-Cache abschließen (nur Rank 0)
+        if cache is not None and not time_budget_reached:
+            # Durch das Zeitbudget verkürzte Läufe sind nicht reproduzierbar und werden nicht gecacht
+            cache.store(cache_key, experiments_dir_path, train_losses, val_losses, val_loss_final, test_loss)
+        if store is not None:
+            status = "time_budget" if time_budget_reached else "early_stopped" if completed else "finished"
+            store.finish_run(run_id, status=status,
+                             best_checkpoint=best_checkpoint_path(experiments_dir_path), test_loss=test_loss,
+                             wall_time_s=time.monotonic() - start_time, optimized_params=optimized_params,
+                             stage_timings=profiler.summary()["stages"] if profiler is not None else None)
+            store.close()
+        if profiler is not None:
+            profiler.write()
 
     # Trainings-Schleife
-    for epoch in range(epochs):
-        avg_train_loss , preds_train, targets_train = train_model(model, train_loader,optimizer, criterion)
-        if save_train_pred:
-            all_preds_train.append(preds_train)
-            all_targets_train.append(targets_train)
-        train_losses.append(avg_train_loss)
-        # Validierung nach jeder Epoche
-        avg_val_loss= test_model(experiments_dir_path, model, val_loader, criterion, split = "val")
-        val_losses.append(avg_val_loss)
-
-        logging.warning(f"Epoch {epoch + 1}/{epochs}: Train Loss = {avg_train_loss:.4f}, Val Loss = {avg_val_loss:.4f}")
-        save_losses_and_model(experiments_dir_path, train_losses, val_losses, model, epoch)
+    for epoch in range(start_epoch, epochs):
+        if completed:
+            break
+        # Rank 0 entscheidet über das Zeitbudget, damit alle Prozesse gemeinsam abbrechen
+        if broadcast_object(max_training_time is not None and time.monotonic() - start_time >= max_training_time):
+            logging.warning(f"Zeitbudget von {max_training_time}s vor Epoche {epoch + 1} erreicht")
+            time_budget_reached = True
+            break
+        if distributed:
+            train_sampler.set_epoch(epoch)
+        with profile_epoch(epoch):
+            epoch_start = time.monotonic()
+            # Trainingsvorhersagen (der jeweils letzten Epoche) nur auf Anfrage sammeln
+            avg_train_loss , preds_train, targets_train = train_model(training_model, train_loader,optimizer, criterion,
+                                                                      mixed_precision=mixed_precision,
+                                                                      collect_predictions=save_train_pred,
+                                                                      importance_sampler=importance_sampler)
+            avg_train_loss = reduce_mean(avg_train_loss)
+            throughputs.append(len(train_loader) * batch_size * get_world_size() / (time.monotonic() - epoch_start))
+            train_losses.append(avg_train_loss)
+            # Validierung nach jeder Epoche
+            avg_val_loss= test_model(experiments_dir_path, model, epoch_val_loader, criterion, split = "val",
+                                     mixed_precision=mixed_precision, save=not distributed, writer=val_writer)
+            val_losses.append(avg_val_loss)
+
+        current_lr = optimizer.param_groups[0]["lr"]
+        elapsed_time = time.monotonic() - start_time
+        logging.warning(f"Epoch {epoch + 1}/{epochs}: Train Loss = {avg_train_loss:.4f}, Val Loss = {avg_val_loss:.4f}, "
+                        f"LR = {current_lr:.2e}, Zeit = {elapsed_time:.1f}s, {throughputs[-1]:.0f} samples/s")
+        if store is not None:
+            store.log_epoch(run_id, epoch, avg_train_loss, avg_val_loss, learning_rate=current_lr, elapsed_s=elapsed_time,
+                            samples_per_s=throughputs[-1])
 
+        if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+            scheduler.step(avg_val_loss)
+        elif scheduler is not None:
+            scheduler.step()
+        if early_stopping is not None and early_stopping.step(avg_val_loss):
+            logging.warning(f"Early Stopping nach Epoche {epoch + 1}: keine Verbesserung seit {early_stopping.patience} Epochen")
+            completed = True
+        completed = broadcast_object(completed)
+
+        # Vollständiger Zustand zum Fortsetzen nach einem Abbruch
+        training_state = {
+            "fingerprint": fingerprint,
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": scheduler.state_dict() if scheduler is not None else None,
+            "early_stopping": early_stopping.state_dict() if early_stopping is not None else None,
+            "importance_sampler": importance_sampler.state_dict() if importance_sampler is not None else None,
+            "epoch": epoch,
+            "train_losses": train_losses,
+            "val_losses": val_losses,
+            "elapsed_time": elapsed_time,
+            "completed": completed,
+            "rng": capture_rng_state(),
+        }
+        if is_main_process():
+            save_losses_and_model(experiments_dir_path, train_losses, val_losses, model, epoch, checkpoint_manager,
+                                  training_state)
+
+    if not is_main_process():
+        barrier()
+        return train_losses, val_losses, None, None
+
+    checkpoint_manager.close()
+    val_writer.close()
+    if throughputs:
+        with open(experiments_dir_path / "throughput.json", "w") as f:
+            json.dump({"world_size": get_world_size(), "batch_size_per_process": batch_size,
+                       "samples_per_second": throughputs}, f)
+    if not config.get("final_evaluation", True):
+        finish_run(float(np.min(val_losses)))
+        barrier()
+        return train_losses, val_losses, float(np.min(val_losses)), None
     logging.warning("Training completed. Now determining the best epoch and evaluate model on test dataset.")
     # Bestes Modell basierend auf Validierungsverlust auswählen und evaluieren
-    val_loss_final, test_loss= evaluate_best_model(experiments_dir_path, val_losses, model, test_loader, val_loader, criterion)
-    optimize_regelparams_for_trained_model(model=model, dataset=train_loader.dataset, root=experiments_dir_path)
+    optimization_method = config.get("regelparam_optimizer", "grid")
+    objective_cache = None
+    if config.get("objective_cache") is not None:
+        # Bereits ausgewertete Regelparameter (auch aus früheren Läufen) nicht erneut vorhersagen
+        objective_cache = ObjectiveCache(config["objective_cache"])
+        set_objective_cache(objective_cache)
+    val_loss_final, test_loss= evaluate_best_model(experiments_dir_path, model, test_loader, val_loader, criterion,
+                                                   mixed_precision=mixed_precision)
+    # Einmalige Regelparameter-Optimierung mit dem besten Modell (Methode und Risikoaversion laut Konfiguration)
+    optimized_params = optimize_regelparams_for_trained_model(model=model, dataset=train_loader.dataset,
+                                                              root=experiments_dir_path, mixed_precision=mixed_precision,
+                                                              method=optimization_method,
+                                                              risk_aversion=config.get("risk_aversion"),
+                                                              mc_samples=config.get("mc_dropout_samples", 16))
+    if config.get("schedule_optimization", False):
+        # Regelparameter je Außentemperaturband und Betriebsart (schedule.csv)
+        optimize_schedule_for_trained_model(model, test_loader.dataset, experiments_dir_path,
+                                            n_bands=config.get("schedule_n_bands", 4), mixed_precision=mixed_precision)
+    if config.get("pareto_optimization", False):
+        # Zielkonflikt Rücklauftemperatur vs. Komfort (pareto_front.csv)
+        pareto_front_for_trained_model(model, test_loader.dataset, experiments_dir_path, mixed_precision=mixed_precision)
+    if config.get("sensitivity_analysis", False):
+        # Sobol- und Morris-Indizes für Regelparameter und Außentemperatur (sensitivity.json)
+        sensitivity_for_trained_model(model, test_loader.dataset, experiments_dir_path,
+                                      n_samples=config.get("sensitivity_samples", 1024), mixed_precision=mixed_precision)
+    if objective_cache is not None:
+        objective_cache.log_stats()
+        objective_cache.close()
+        set_objective_cache(None)
+    if config.get("compress_predictions", False):
+        compress_predictions(experiments_dir_path)
+    finish_run(val_loss_final, test_loss=test_loss, optimized_params=optimized_params)
+    barrier()
 
     return train_losses, val_losses, val_loss_final, test_loss
 
-def evaluate_best_model(experiments_dir_path, val_losses, model, test_loader, val_loader, criterion):
-    """Lädt das Modell mit dem besten Validierungsverlust und evaluiert es."""
-    best_epoch = np.argmin(val_losses)
-    model.load_state_dict(torch.load(experiments_dir_path/f"model_{best_epoch}.pt"))
-    test_loss = test_model(experiments_dir_path,model, test_loader, criterion, split = "test")
-    val_loss = test_model(experiments_dir_path,model, val_loader, criterion, split = "val")
-    optimize_regelparams_for_trained_model(model=model, dataset=test_loader.dataset, root=experiments_dir_path)
+def evaluate_best_model(experiments_dir_path, model, test_loader, val_loader, criterion, mixed_precision=False):
+    """
+    Lädt das Modell mit dem besten Validierungsverlust (laut Checkpoint-Manifest) und evaluiert es.
+    Die Regelparameter-Optimierung führt `train_and_optimize` anschließend einmal mit der konfigurierten Methode durch.
+    """
+    model.load_state_dict(torch.load(best_checkpoint_path(experiments_dir_path)))
+    test_loss = test_model(experiments_dir_path,model, test_loader, criterion, split = "test", mixed_precision=mixed_precision)
+    val_loss = test_model(experiments_dir_path,model, val_loader, criterion, split = "val", mixed_precision=mixed_precision)
     return val_loss, test_loss
 
-def train_model(model, train_loader, optimizer, criterion):
+@profiled("train_epoch")
+def train_model(model, train_loader, optimizer, criterion, mixed_precision=False, collect_predictions=False,
+                importance_sampler=None):
+    """
+    Führt eine Trainings-Epoche durch (optional mit bfloat16-Autocast für die Forward-Pässe).
+
+    Verluste werden ohne Synchronisation pro Batch aufsummiert. Vorhersagen und Targets werden nur mit
+    `collect_predictions=True` gesammelt, sonst ist der Rückgabewert dafür None. Mit `importance_sampler`
+    erhält dieser den L1-Verlust je Sample für die Gewichtung der nächsten Epoche.
+    """
     model.train()
-    total_loss = 0
-    for inputs, targets in train_loader:
+    metrics = MetricsAccumulator(train_loader.dataset, device, n_samples=len(train_loader) * train_loader.batch_size,
+                                 collect_predictions=collect_predictions, per_setup=False)
+    for inputs, targets in profiled_batches(train_loader):
         inputs = inputs.to(torch.float32).to(device)
         targets = targets.to(torch.float32).to(device)
 
         optimizer.zero_grad()
-        outputs = model(inputs)
-        loss = criterion(torch.squeeze(outputs), targets)
-        loss.backward()
-        optimizer.step()
+        with profile_stage("forward", samples=inputs.shape[0]):
+            with bf16_autocast(device, enabled=mixed_precision):
+                outputs = model(inputs)
+            # Loss in float32 berechnen, auch wenn die Outputs in bfloat16 vorliegen
+            outputs = outputs.float()
+            loss = criterion(torch.squeeze(outputs), targets)
+        with profile_stage("backward", samples=inputs.shape[0]):
+            loss.backward()
+            optimizer.step()
 
-        total_loss += loss.item()
-        all_preds_train= outputs.detach().cpu().numpy()
-        all_targets_train =targets.detach().cpu().numpy()
+        metrics.update(loss, outputs, targets)
+        if importance_sampler is not None:
+            importance_sampler.record(torch.abs(outputs.detach().reshape(targets.shape) - targets).mean(dim=1))
 
-    avg_train_loss = total_loss / len(train_loader)
-    return avg_train_loss, all_preds_train, all_targets_train
+    results = metrics.compute()
+    return results["loss"], results.get("predictions"), results.get("targets")
 
-def test_model(experiments_dir_path,model, loader, criterion, split = "train"):
-    """Führt eine Trainings-Epoche durch."""
-    all_preds_test = []
-    all_targets_test = []
-    test_losses= []
+@profiled("evaluate")
+def test_model(experiments_dir_path,model, loader, criterion, split = "train", mixed_precision=False, save=True, writer=None):
+    """
+    Evaluiert das Modell auf `loader` (optional mit bfloat16-Autocast) und gibt den mittleren Verlust zurück.
 
-    total_val_loss = 0
+    Mit `save=True` werden Vorhersagen und Targets batchweise über einen `PredictionWriter` (wiederverwendbar über
+    `writer`) in speichergemappte Dateien geschrieben sowie der MAE je Horizont-Schritt und je Regelparameter-Setup
+    (`{split}_metrics.npz`) gespeichert. Der Loader muss dafür in fester Reihenfolge (shuffle=False) iterieren.
+    """
+    n_samples = len(loader) * loader.batch_size
+    metrics = MetricsAccumulator(loader.dataset, device, n_samples=n_samples)
+    if save:
+        writer = writer if writer is not None else PredictionWriter(experiments_dir_path, split, n_samples)
+        writer.reset()
     model.eval()
     model.to(device)
     with torch.no_grad():
-        for inputs, targets in loader:
+        for inputs, targets in profiled_batches(loader, "eval_data_loading"):
             inputs = inputs.to(torch.float32).to(device)
             targets = targets.to(torch.float32).to(device)
 
-            outputs = model(inputs)
-            loss = criterion(np.squeeze(outputs), targets)
-            total_val_loss += loss.item()
-
-            all_preds_test.append(outputs.detach().cpu().numpy())
-            all_targets_test.append(targets.detach().cpu().numpy())
+            with profile_stage("eval_forward", samples=inputs.shape[0]), bf16_autocast(device, enabled=mixed_precision):
+                outputs = model(inputs)
+            outputs = outputs.float()
+            loss = criterion(torch.squeeze(outputs), targets)
+            metrics.update(loss, outputs, targets)
+            if save:
+                writer.write(outputs.cpu().numpy(), targets.cpu().numpy())
 
-    avg_val_loss = total_val_loss / len(loader)
-    test_losses.append(avg_val_loss)
-    save_predictions(experiments_dir_path,all_preds_test,all_targets_test, split = split)
+    results = metrics.compute()
+    if isinstance(loader.sampler, DistributedSampler):
+        # Jeder Prozess hat nur seinen Teil gesehen: Verlustsummen und Batch-Anzahlen aller Prozesse zusammenführen
+        results["loss"] = all_reduce_mean(metrics.loss_sum.item(), metrics.n_batches)
+    if save:
+        writer.flush()
+        np.savez(Path(experiments_dir_path) / f"{split}_metrics.npz", mae_per_step=results["mae_per_step"],
+                 **({"mae_per_setup": results["mae_per_setup"]} if "mae_per_setup" in results else {}))
 
-    return  np.mean(test_losses)
+    return results["loss"]
 
 if __name__ == "__main__":
     # ---- Konfiguration der Trainingsparameter ----
@@ -131,17 +455,39 @@ if __name__ == "__main__":
         "learning_rate":0.001,
         "kernel_size" : 5,
         "pool" : False,
-        "test_run" :True
+        "test_run" :True,
+        "early_stopping_patience": 5,
+        "early_stopping_min_delta": 0.0,
+        "lr_scheduler": "plateau",
+        "max_training_time": None,
+        "mixed_precision": False,
+        "compress_predictions": False,
+        "profile": False,
+        "profile_epochs": [],
+        "experiment_db": "../experiments/experiments.db",
+        "seed": 0,
+        "training_cache": "../experiments/cache",
+        "regelparam_optimizer": "grid",
+        "risk_aversion": None,
+        "mc_dropout_samples": 16,
+        "schedule_optimization": False,
+        "pareto_optimization": False,
+        "sensitivity_analysis": False,
+        "objective_cache": "../experiments/objective_cache.db"
 
     }
+    # Verteiltes Training, falls über torchrun gestartet (z. B. torchrun --nproc_per_node=4 training.py)
+    init_distributed()
     # Erstellen des Verzeichnisses für Experiment-Ergebnisse
     experiments_dir = Path("../experiments") / f"Test_Run_with_dummy_data/"
-    if not experiments_dir.exists():
-        experiments_dir.mkdir(parents=True)
-    with open(experiments_dir/"config.json", "w") as config_file:
-        json.dump(config, config_file)
+    if is_main_process():
+        experiments_dir.mkdir(parents=True, exist_ok=True)
+        with open(experiments_dir/"config.json", "w") as config_file:
+            json.dump(config, config_file)
 
     train_dataset, val_dataset, test_dataset = import_data(time_horizon= config["time_horizon"],test_run=config["test_run"])
+    # Seed vor dem Erzeugen des Modells setzen, damit auch die Initialisierung reproduzierbar ist
+    set_seed(config["seed"])
 
     # ---- Modell-Auswahl und Training (hier CNN) ----
     # MLP und LSTM sind auskommentiert
@@ -154,12 +500,15 @@ if __name__ == "__main__":
     model = CNNModel(sequence_length=config["time_horizon"],n_layers = config["n_layers"], batch_norm = config["batch_norm"],
                      dropout_rate= config["dropout"], kernel_size=config["kernel_size"], pool = config["pool"], size_out=config["time_horizon"])
     # Training starten und Regelparameter optimieren
-    train_losses, val_losses , val_loss_final, test_loss = train_and_optimize(train_dataset, val_dataset,experiments_dir/"CNN", model, config)
-    # Verluste plotten
-    plot_losses(train_losses, val_losses, num_epochs=config["epochs"], title="Training and Validation Loss of CNN-based Model")
+    train_losses, val_losses , val_loss_final, test_loss = train_and_optimize(train_dataset, val_dataset,experiments_dir/"CNN", model, config,
+                                                                               test_dataset=test_dataset)
+    if is_main_process():
+        # Verluste plotten
+        plot_losses(train_losses, val_losses, num_epochs=len(train_losses), title="Training and Validation Loss of CNN-based Model")
 
-    logging.warning(f"Final Test Loss = {test_loss}, Final Val Loss=  {val_loss_final:.4f}")
-    logging.warning(config)
+        logging.warning(f"Final Test Loss = {test_loss}, Final Val Loss=  {val_loss_final:.4f}")
+        logging.warning(config)
+    cleanup_distributed()
 
     # # #LSTM
     # model = LSTMModel()
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import torch
+
+from utils import load_manifest, atomic_write, CheckpointManager, TRAINING_STATE_FILE
+
+# Konfigurationsschlüssel, die das Trainingsergebnis nicht beeinflussen und daher nicht in den Schlüssel eingehen
+NON_SEMANTIC_KEYS = {"resume", "profile", "profile_epochs", "experiment_db", "experiment_group", "training_cache",
+                     "training_cache_max_entries", "training_cache_max_age_days", "compress_predictions", "keep_top_k"}
+# Ergebnisdateien eines Experiment-Verzeichnisses, die zusätzlich zum besten Modell gespeichert werden
+RESULT_FILES = ("train_losses.npy", "val_losses.npy", "val_metrics.npz", "test_metrics.npz", "optimized_params.json",
+                "optimized_params_train.json", "throughput.json")
+RESULT_NAME = "result.json"
+
+
+def clear_run_artifacts(experiments_dir_path):
+    """
+    Entfernt Checkpoints, Manifest, Trainingszustand und Ergebnisdateien eines früheren Laufs, damit ein
+    wiederhergestellter Eintrag nicht mit Dateien gemischt wird, die sein Manifest nicht beschreibt.
+    """
+    names = {CheckpointManager.manifest_name, TRAINING_STATE_FILE, *RESULT_FILES}
+    names.update(path.name for path in experiments_dir_path.glob("model_*.pt"))
+    for name in names:
+        (experiments_dir_path / name).unlink(missing_ok=True)
+
+
+def run_fingerprint(config, data_hash, model):
+    """
+    Kennung eines Laufs zum Fortsetzen: Hash aus Konfiguration, Daten-Hash und Modellarchitektur.
+
+    Anders als der Cache-Schlüssel ohne Code-Version und ohne `max_training_time`, damit ein durch das Zeitbudget
+    abgebrochener Lauf nach einer Code-Änderung oder mit größerem Budget fortgesetzt werden kann.
+    """
+    relevant_config = {k: v for k, v in config.items() if k not in NON_SEMANTIC_KEYS | {"max_training_time"}}
+    payload = json.dumps({"config": relevant_config, "data": data_hash, "model": repr(model)}, sort_keys=True,
+                         default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def code_version():
+    """Hash über alle Quelldateien in `src` sowie die torch-Version."""
+    digest = hashlib.sha256(torch.__version__.encode())
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class TrainingCache:
+    """
+    Inhaltsadressierter Cache für abgeschlossene Trainingsläufe.
+
+    Der Schlüssel ist ein Hash aus Konfiguration (ohne Logging-/Profiling-Schalter), Inhalts-Hash der Daten,
+    Modellarchitektur, Code-Version und Seed. Ein Eintrag enthält das beste Modell, die Verlaufs- und
+    Ergebnisdateien sowie die Rückgabewerte von `train_and_optimize`. Geänderter Code oder geänderte Daten führen
+    automatisch zu einem neuen Schlüssel; alte Einträge werden nach Anzahl bzw. Alter (LRU) entfernt.
+    """
+    def __init__(self, cache_dir, max_entries=20, max_age_days=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+
+    @staticmethod
+    def key(config, data_hash, model):
+        """Cache-Schlüssel eines Laufs; ohne Seed ist das Training nicht reproduzierbar und es gibt keinen Schlüssel."""
+        if config.get("seed") is None:
+            return None
+        relevant_config = {k: v for k, v in config.items() if k not in NON_SEMANTIC_KEYS}
+        payload = json.dumps({"config": relevant_config, "data": data_hash, "model": repr(model),
+                              "code": code_version()}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def load(self, key, experiments_dir_path, model):
+        """
+        Stellt einen abgeschlossenen Lauf im Experiment-Verzeichnis wieder her und lädt das beste Modell in `model`.
+        Checkpoints, Manifest und `training_state.pt` eines früheren Laufs im Verzeichnis werden vorher entfernt,
+        sodass ein späteres `resume` nicht an einen fremden Zustand anknüpft.
+        :return: Rückgabewerte von `train_and_optimize` oder None, wenn kein Eintrag existiert.
+        """
+        if key is None:
+            return None
+        entry = self.cache_dir / key
+        if not (entry / RESULT_NAME).exists():
+            return None
+        with open(entry / RESULT_NAME, "r") as f:
+            result = json.load(f)
+        experiments_dir_path = Path(experiments_dir_path)
+        experiments_dir_path.mkdir(parents=True, exist_ok=True)
+        clear_run_artifacts(experiments_dir_path)
+        for path in entry.iterdir():
+            if path.name != RESULT_NAME:
+                shutil.copy2(path, experiments_dir_path / path.name)
+        model.load_state_dict(torch.load(entry / load_manifest(entry)["best"][0]["file"]))
+        # Zeitstempel der letzten Nutzung für die LRU-Bereinigung
+        os.utime(entry / RESULT_NAME)
+        logging.warning(f"Trainings-Cache-Treffer {key[:12]}: Ergebnis aus {entry} übernommen")
+        return result["train_losses"], result["val_losses"], result["val_loss_final"], result["test_loss"]
+
+    def store(self, key, experiments_dir_path, train_losses, val_losses, val_loss_final, test_loss):
+        """Übernimmt bestes Modell und Ergebnisdateien eines abgeschlossenen Laufs als neuen Eintrag."""
+        if key is None:
+            return
+        experiments_dir_path = Path(experiments_dir_path)
+        manifest = load_manifest(experiments_dir_path)
+        best = manifest["best"][0]
+        # Zuerst in ein temporäres Verzeichnis schreiben, damit nur vollständige Einträge sichtbar werden
+        tmp_entry = self.cache_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+        tmp_entry.mkdir()
+        shutil.copy2(experiments_dir_path / best["file"], tmp_entry / best["file"])
+        for name in RESULT_FILES:
+            if (experiments_dir_path / name).exists():
+                shutil.copy2(experiments_dir_path / name, tmp_entry / name)
+        atomic_write(tmp_entry / CheckpointManager.manifest_name,
+                     lambda f: json.dump({"best": [best], "latest": best}, f, indent=2), mode="w")
+        result = {"train_losses": [float(v) for v in train_losses], "val_losses": [float(v) for v in val_losses],
+                  "val_loss_final": None if val_loss_final is None else float(val_loss_final),
+                  "test_loss": None if test_loss is None else float(test_loss), "created": time.time()}
+        atomic_write(tmp_entry / RESULT_NAME, lambda f: json.dump(result, f, indent=2), mode="w")
+        entry = self.cache_dir / key
+        try:
+            os.replace(tmp_entry, entry)
+        except OSError:
+            # Ein paralleler Lauf hat denselben Eintrag bereits angelegt
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        logging.warning(f"Trainings-Cache: Lauf unter {key[:12]} gespeichert")
+        self.gc()
+
+    def gc(self):
+        """Entfernt verwaiste temporäre Einträge, zu alte Einträge und die am längsten ungenutzten über `max_entries`."""
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if not path.is_dir():
+                continue
+            if path.name.startswith("."):
+                # Abgebrochene Schreibvorgänge älter als eine Stunde
+                if now - path.stat().st_mtime > 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            if not (path / RESULT_NAME).exists():
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            entries.append((path, (path / RESULT_NAME).stat().st_mtime))
+        entries.sort(key=lambda item: item[1], reverse=True)
+        for i, (path, last_used) in enumerate(entries):
+            too_old = self.max_age_days is not None and now - last_used > self.max_age_days * 86400
+            if too_old or (self.max_entries is not None and i >= self.max_entries):
+                shutil.rmtree(path, ignore_errors=True)
+                logging.warning(f"Trainings-Cache: Eintrag {path.name[:12]} entfernt")
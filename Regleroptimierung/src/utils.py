@@ -1,15 +1,33 @@
 import numpy as np
 import logging
 import matplotlib.pyplot as plt
+import io
+import json
+import os
+import queue
+import random
 import sys
+import threading
+import time
 import torch
 from pathlib import Path
 
+from profiling import profiled
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def save_losses_and_model(target_path, train_losses, val_losses, model, epoch):
-    """Speichert die Trainings- und Validierungsverluste sowie den aktuellen Modellzustand (state_dict)."""
+@profiled("checkpoint")
+def save_losses_and_model(target_path, train_losses, val_losses, model, epoch, checkpoint_manager=None,
+                          training_state=None):
+    """Speichert die Trainings- und Validierungsverluste sowie den aktuellen Modellzustand (state_dict).
+
+    Ist ein `CheckpointManager` übergeben, wird das Speichern an diesen delegiert (Top-k, im Hintergrund).
+    Ein optionaler `training_state` (siehe `capture_rng_state`) wird als `training_state.pt` zum Fortsetzen abgelegt.
+    """
+    if checkpoint_manager is not None:
+        checkpoint_manager.save(train_losses, val_losses, model, epoch, training_state)
+        return
 
     try:
         target_path = Path(target_path)
@@ -18,6 +36,8 @@ def save_losses_and_model(target_path, train_losses, val_losses, model, epoch):
         np.save(target_path / 'train_losses.npy', np.array(train_losses))
         np.save(target_path / 'val_losses.npy', np.array(val_losses))
         torch.save(model.state_dict(), target_path / f"model_{epoch}.pt")
+        if training_state is not None:
+            atomic_write(target_path / TRAINING_STATE_FILE, lambda f: torch.save(training_state, f))
 
         logger.warning(f"Model gespeichert unter {target_path} /model_{epoch}.pt")
 
@@ -25,6 +45,152 @@ def save_losses_and_model(target_path, train_losses, val_losses, model, epoch):
         logger.error(f"Fehler beim Speichern: {e}")
         raise e
 
+TRAINING_STATE_FILE = "training_state.pt"
+
+def set_seed(seed):
+    """Setzt die Seeds von Python, NumPy und PyTorch."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+def capture_rng_state():
+    """Erfasst die Zustände aller Zufallszahlengeneratoren (Python, NumPy, PyTorch, ggf. CUDA)."""
+    rng_state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        rng_state["cuda"] = torch.cuda.get_rng_state_all()
+    return rng_state
+
+def restore_rng_state(rng_state):
+    """Stellt die mit `capture_rng_state` erfassten Zustände wieder her."""
+    random.setstate(rng_state["python"])
+    np.random.set_state(rng_state["numpy"])
+    torch.set_rng_state(rng_state["torch"])
+    if "cuda" in rng_state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_state["cuda"])
+
+def load_training_state(target_path):
+    """Lädt den zuletzt gespeicherten Trainingszustand oder None, falls keiner existiert."""
+    state_path = Path(target_path) / TRAINING_STATE_FILE
+    if not state_path.exists():
+        return None
+    return torch.load(state_path, weights_only=False)
+
+def cpu_copy(obj):
+    """Rekursive Kopie eines (state_dict-artigen) Objekts mit allen Tensoren auf der CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {k: cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(cpu_copy(v) for v in obj)
+    return obj
+
+def atomic_write(path, write_fn, mode="wb"):
+    """Schreibt eine Datei atomar: zuerst in eine temporäre Datei im selben Verzeichnis, dann os.replace."""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_manifest(target_path):
+    """Lädt das Checkpoint-Manifest (checkpoints.json) eines Experiment-Verzeichnisses."""
+    with open(Path(target_path) / CheckpointManager.manifest_name, "r") as f:
+        return json.load(f)
+
+def best_checkpoint_path(target_path):
+    """Pfad des Checkpoints mit dem geringsten Validierungsverlust laut Manifest."""
+    manifest = load_manifest(target_path)
+    return Path(target_path) / manifest["best"][0]["file"]
+
+class CheckpointManager:
+    """
+    Behält nur die besten k Modelle nach Validierungsverlust sowie das jeweils letzte Modell.
+
+    Die Dateien (Modelle, Verlust-Arrays und das Manifest `checkpoints.json`) werden atomar aus einem
+    Hintergrund-Thread geschrieben, damit die Trainings-Schleife nicht auf I/O wartet.
+    """
+    manifest_name = "checkpoints.json"
+
+    def __init__(self, target_path, keep_top_k=3):
+        self.target_path = Path(target_path)
+        self.target_path.mkdir(parents=True, exist_ok=True)
+        self.keep_top_k = keep_top_k
+        if (self.target_path / self.manifest_name).exists():
+            self.manifest = load_manifest(self.target_path)
+        else:
+            self.manifest = {"best": [], "latest": None}
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def save(self, train_losses, val_losses, model, epoch, training_state=None):
+        """Übernimmt eine Kopie des Modellzustands und plant das Schreiben im Hintergrund ein."""
+        self._raise_error()
+        state_dict = cpu_copy(model.state_dict())
+        training_state = cpu_copy(training_state)
+        entry = {"epoch": int(epoch), "val_loss": float(val_losses[-1]), "file": f"model_{epoch}.pt"}
+
+        previous_files = {e["file"] for e in self.manifest["best"]}
+        if self.manifest["latest"] is not None:
+            previous_files.add(self.manifest["latest"]["file"])
+        candidates = [e for e in self.manifest["best"] if e["epoch"] != entry["epoch"]] + [entry]
+        self.manifest = {
+            "best": sorted(candidates, key=lambda e: e["val_loss"])[:self.keep_top_k],
+            "latest": entry,
+        }
+        kept_files = {e["file"] for e in self.manifest["best"]} | {entry["file"]}
+        obsolete_files = previous_files - kept_files
+        manifest = json.loads(json.dumps(self.manifest))
+
+        self._queue.put((state_dict, entry["file"], np.array(train_losses), np.array(val_losses), manifest, obsolete_files,
+                         training_state))
+
+    def wait(self):
+        """Wartet, bis alle ausstehenden Schreibvorgänge abgeschlossen sind."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                state_dict, file_name, train_losses, val_losses, manifest, obsolete_files, training_state = job
+                atomic_write(self.target_path / file_name, lambda f: torch.save(state_dict, f))
+                atomic_write(self.target_path / 'train_losses.npy', lambda f: np.save(f, train_losses))
+                atomic_write(self.target_path / 'val_losses.npy', lambda f: np.save(f, val_losses))
+                atomic_write(self.target_path / self.manifest_name, lambda f: json.dump(manifest, f, indent=2), mode="w")
+                if training_state is not None:
+                    atomic_write(self.target_path / TRAINING_STATE_FILE, lambda f: torch.save(training_state, f))
+                for obsolete in obsolete_files:
+                    (self.target_path / obsolete).unlink(missing_ok=True)
+                logger.warning(f"Model gespeichert unter {self.target_path} /{file_name}")
+            except Exception as e:
+                logger.error(f"Fehler beim Speichern: {e}")
+                self._error = e
+            finally:
+                self._queue.task_done()
+
 def save_predictions(target_path, all_train_preds, all_train_targets, split = "unknown"):
     """Speichert die vorhergesagten und die tatsächlichen Zielwerte (Targets) als NumPy-Arrays."""
 
@@ -39,6 +205,103 @@ def save_predictions(target_path, all_train_preds, all_train_targets, split = "u
         logger.error(f"Fehler beim Speichern: {e}")
         raise e
 
+def bf16_autocast(device, enabled=True):
+    """
+    bfloat16-Autocast für Forward-Pässe auf `device`.
+
+    Die Gewichte bleiben float32 (Master-Gewichte), nur die Rechnungen laufen in bfloat16. Da bfloat16 den
+    Exponentenbereich von float32 hat, ist kein Loss-Scaling nötig.
+    """
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=enabled)
+
+class PredictionWriter:
+    """
+    Schreibt Vorhersagen und Targets batchweise in vorab allokierte, speichergemappte `{split}_preds.npy` /
+    `{split}_targets.npy`.
+
+    Die Dateien werden beim ersten Batch mit der endgültigen Form (n_samples, ...) angelegt bzw. bei passender Form
+    wiederverwendet und in-place überschrieben, sodass weder Listen im Speicher gesammelt noch die Dateien je
+    Epoche neu geschrieben werden müssen.
+    """
+    def __init__(self, target_path, split, n_samples, dtype=np.float32):
+        self.target_path = Path(target_path)
+        self.target_path.mkdir(parents=True, exist_ok=True)
+        self.split = split
+        self.n_samples = n_samples
+        self.dtype = np.dtype(dtype)
+        self.arrays = None
+        self.offset = 0
+
+    def _open(self, name, sample_shape):
+        path = self.target_path / f"{self.split}_{name}.npy"
+        shape = (self.n_samples, *sample_shape)
+        if path.exists():
+            existing = np.load(path, mmap_mode="r+")
+            if existing.shape == shape and existing.dtype == self.dtype:
+                return existing
+            del existing
+        return np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=shape)
+
+    def reset(self):
+        """Beginnt einen neuen Durchlauf (z. B. die nächste Validierung) am Dateianfang."""
+        self.offset = 0
+
+    def write(self, preds, targets):
+        preds = np.asarray(preds, dtype=self.dtype)
+        targets = np.asarray(targets, dtype=self.dtype)
+        if self.arrays is None:
+            self.arrays = (self._open("preds", preds.shape[1:]), self._open("targets", targets.shape[1:]))
+        batch_size = preds.shape[0]
+        self.arrays[0][self.offset:self.offset + batch_size] = preds
+        self.arrays[1][self.offset:self.offset + batch_size] = targets
+        self.offset += batch_size
+
+    def flush(self):
+        if self.arrays is not None:
+            for array in self.arrays:
+                array.flush()
+
+    def close(self):
+        self.flush()
+        self.arrays = None
+
+def compress_predictions(target_path, splits=("val", "test")):
+    """Fasst die gespeicherten Vorhersagen am Ende des Trainings in `predictions.npz` (komprimiert) zusammen."""
+    target_path = Path(target_path)
+    arrays = {}
+    for split in splits:
+        for name in ("preds", "targets"):
+            path = target_path / f"{split}_{name}.npy"
+            if path.exists():
+                arrays[f"{split}_{name}"] = np.load(path, mmap_mode="r")
+    atomic_write(target_path / "predictions.npz", lambda f: np.savez_compressed(f, **arrays))
+    del arrays
+    for split in splits:
+        for name in ("preds", "targets"):
+            (target_path / f"{split}_{name}.npy").unlink(missing_ok=True)
+
+def count_parameters(model):
+    """Anzahl der Parameter eines Modells."""
+    return sum(p.numel() for p in model.parameters())
+
+def model_size_bytes(model):
+    """Größe des serialisierten state_dict in Bytes."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+def measure_latency(model, example_inputs, n_runs=50, warmup=5):
+    """Misst die Median-Latenz (in ms) eines Forward-Passes im Eval-Modus auf der CPU."""
+    model.eval()
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + n_runs):
+            start = time.perf_counter()
+            model(example_inputs)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
 def plot_losses(train_losses, val_losses, num_epochs, title = 'Training and Validation Loss Over Epochs'):
     """Plottet den Trainings- und Validierungsverlust über die Epochen."""
     plt.plot(range(1, num_epochs+1), train_losses, label='Training Loss')